@@ -1,10 +1,13 @@
 from typing import AsyncGenerator
 
+import httpx
 from fastapi import Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.repositories.city_repository import CityRepository
 from app.repositories.db import get_db
+from app.repositories.history_repository import WeatherHistoryRepository
+from app.repositories.http_client import get_http_client
 from app.repositories.weather_repository import WeatherRepository
 from app.services.city_service import CityService
 from app.services.weather_service import WeatherService
@@ -20,16 +23,26 @@ async def get_city_repository(db: AsyncSession = Depends(get_db_session)
     return CityRepository(db)
 
 
-async def get_weather_repository(db: AsyncSession = Depends(get_db_session)
-                                 ) -> WeatherRepository:
-    return WeatherRepository(db)
+async def get_weather_repository(
+    db: AsyncSession = Depends(get_db_session),
+    http_client: httpx.AsyncClient = Depends(get_http_client)
+) -> WeatherRepository:
+    return WeatherRepository(db, http_client)
+
+
+async def get_weather_history_repository(
+    db: AsyncSession = Depends(get_db_session)
+) -> WeatherHistoryRepository:
+    return WeatherHistoryRepository(db)
 
 
 async def get_weather_service(
     weather_repo: WeatherRepository = Depends(get_weather_repository),
-    city_repo: CityRepository = Depends(get_city_repository)
+    city_repo: CityRepository = Depends(get_city_repository),
+    history_repo: WeatherHistoryRepository = Depends(
+        get_weather_history_repository)
 ) -> WeatherService:
-    return WeatherService(weather_repo, city_repo)
+    return WeatherService(weather_repo, city_repo, history_repo)
 
 
 async def get_city_service(
@@ -0,0 +1,74 @@
+import time
+from enum import Enum
+
+from app.utils.log import get_logger
+
+logger = get_logger(__name__)
+
+
+class CircuitState(str, Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Предохранитель для запросов к внешнему сервису.
+    После failure_threshold неудачных запросов подряд размыкается и
+    recovery_timeout секунд сразу отклоняет запросы, не дожидаясь таймаутов.
+    Затем пропускает один пробный запрос: при успехе замыкается,
+    при ошибке снова размыкается.
+    """
+
+    def __init__(self, name: str, failure_threshold: int,
+                 recovery_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = CircuitState.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    def allow_request(self) -> bool:
+        """Можно ли выполнить запрос сейчас."""
+        if self.state is CircuitState.CLOSED:
+            return True
+        if self.state is CircuitState.OPEN:
+            if time.monotonic() - self._opened_at < self.recovery_timeout:
+                return False
+            self.state = CircuitState.HALF_OPEN
+            logger.info("Circuit breaker %s is half-open", self.name)
+        # В полуоткрытом состоянии выполняется только один пробный запрос
+        if self._probe_in_flight:
+            return False
+        self._probe_in_flight = True
+        return True
+
+    def record_success(self) -> None:
+        if self.state is not CircuitState.CLOSED:
+            logger.info("Circuit breaker %s is closed", self.name)
+        self.state = CircuitState.CLOSED
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self._probe_in_flight = False
+        self.failures += 1
+        if self.state is CircuitState.OPEN:
+            return  # Ответ на запрос, начатый до размыкания
+        if (self.state is CircuitState.HALF_OPEN
+                or self.failures >= self.failure_threshold):
+            self._open()
+
+    def release(self) -> None:
+        """Завершение запроса без результата (например, при отмене)."""
+        self._probe_in_flight = False
+
+    def _open(self) -> None:
+        logger.warning("Circuit breaker %s is open for %s s after %s "
+                       "failures", self.name, self.recovery_timeout,
+                       self.failures)
+        self.state = CircuitState.OPEN
+        self._opened_at = time.monotonic()
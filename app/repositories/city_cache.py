@@ -0,0 +1,141 @@
+import time
+from collections import OrderedDict
+
+from app import config
+from app.schemas.city import City
+from app.schemas.coordinates import Coordinates
+from app.utils.log import get_logger
+from app.utils.metrics import CallbackMetric
+
+logger = get_logger(__name__)
+
+CoordinatesKey = tuple[float, float]
+
+
+class CityCache:
+    """
+    LRU-кэш городов с погодными записями по ID с поиском по названию
+    и координатам.
+    Город в кэше не изменяется, а заменяется целиком, поэтому читатели
+    видят либо предыдущую, либо новую версию, но не частично примененное
+    обновление.
+    Чтобы город, прочитанный из БД до изменения, не вернулся в кэш после
+    его инвалидации, читатель берет номер поколения до чтения из БД, а put
+    отклоняет город, измененный после этого поколения.
+    Записи живут не дольше ttl секунд: изменения, сделанные другими
+    процессами, становятся видны не позже чем через ttl.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        # ID -> (действует до, город)
+        self._entries: OrderedDict[int, tuple[float, City]] = OrderedDict()
+        self._names: dict[str, int] = {}
+        self._coordinates: dict[CoordinatesKey, int] = {}
+        self._generation = 0
+        # ID -> поколение последнего изменения города
+        self._changed_at: dict[int, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def make_key(coordinates: Coordinates) -> CoordinatesKey:
+        return coordinates.latitude, coordinates.longitude
+
+    def generation(self) -> int:
+        """Текущее поколение - берется перед чтением города из БД."""
+        return self._generation
+
+    def get_by_id(self, city_id: int) -> City | None:
+        entry = self._entries.get(city_id)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                self._remove(city_id)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(city_id)
+        self.hits += 1
+        return entry[1]
+
+    def get_by_name(self, name: str) -> City | None:
+        city_id = self._names.get(name)
+        if city_id is None:
+            self.misses += 1
+            return None
+        return self.get_by_id(city_id)
+
+    def get_by_coord(self, coordinates: Coordinates) -> City | None:
+        city_id = self._coordinates.get(self.make_key(coordinates))
+        if city_id is None:
+            self.misses += 1
+            return None
+        return self.get_by_id(city_id)
+
+    def put(self, city: City, generation: int) -> None:
+        """Добавляет город, прочитанный из БД в поколении generation,
+        если после этого город не изменялся."""
+        if self._changed_at.get(city.id, -1) > generation:
+            logger.debug("City %s changed while loading, not caching",
+                         city.id)
+            return
+        self._remove(city.id)
+        self._entries[city.id] = (time.monotonic() + self.ttl, city)
+        self._names[city.name] = city.id
+        self._coordinates[self.make_key(city.coordinates)] = city.id
+        while len(self._entries) > self.max_size:
+            self._remove(next(iter(self._entries)))
+
+    def replace(self, city: City) -> None:
+        """Заменяет город новой версией, сохраненной в БД."""
+        self._mark_changed(city.id)
+        self.put(city, self._generation)
+
+    def invalidate(self, city_id: int) -> None:
+        """Удаляет город, измененный в БД; следующее чтение загрузит его
+        заново."""
+        self._mark_changed(city_id)
+        self.invalidations += 1
+        self._remove(city_id)
+
+    def _mark_changed(self, city_id: int) -> None:
+        self._generation += 1
+        self._changed_at[city_id] = self._generation
+
+    def _remove(self, city_id: int) -> None:
+        entry = self._entries.pop(city_id, None)
+        if entry is None:
+            return
+        city = entry[1]
+        if self._names.get(city.name) == city_id:
+            del self._names[city.name]
+        key = self.make_key(city.coordinates)
+        if self._coordinates.get(key) == city_id:
+            del self._coordinates[key]
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+
+city_cache = CityCache(max_size=config.CITY_CACHE_SIZE,
+                       ttl=config.CITY_CACHE_TTL)
+
+CallbackMetric("city_cache_size", "Cities in the in-process city cache",
+               "gauge", lambda: len(city_cache))
+CallbackMetric("city_cache_hits_total", "City cache hits",
+               "counter", lambda: city_cache.hits)
+CallbackMetric("city_cache_misses_total", "City cache misses",
+               "counter", lambda: city_cache.misses)
+CallbackMetric("city_cache_invalidations_total",
+               "Cities removed from the cache after a weather update",
+               "counter", lambda: city_cache.invalidations)
@@ -1,16 +1,25 @@
-from sqlalchemy import and_
+from datetime import datetime
+from typing import AsyncIterator, Callable, Iterable
+
+from sqlalchemy import Row, func, insert, or_, tuple_, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy.orm import joinedload
-from sqlalchemy.sql import Select
+from sqlalchemy.orm import noload, selectinload
+from sqlalchemy.sql import Insert, Select, Update
 
-from app.repositories.db import transaction
-from app.repositories.models import CityORM, WeatherORM
-from app.schemas.city import City
+from app.repositories.city_cache import city_cache
+from app.repositories.db import get_upsert_insert, transaction
+from app.repositories.models import CityDataVersionORM, CityORM, WeatherORM
+from app.repositories.spatial_index import city_spatial_index
+from app.schemas.city import City, CityWeatherUpdate, DataVersion
 from app.schemas.coordinates import Coordinates
-from app.schemas.weather import Weather
-from app.utils.exceptions import CityNotFoundError
-from app.utils.log import logger
+from app.schemas.weather import WEATHER_FIELDS
+from app.schemas.weather_series import WeatherSeries
+from app.utils.dates import utc_now
+from app.utils.exceptions import CityNotFoundError, WeatherInCityNotFoundError
+from app.utils.log import get_logger
+
+logger = get_logger(__name__)
 
 
 class CityRepository:
@@ -18,109 +27,550 @@ class CityRepository:
     def __init__(self, db_session: AsyncSession):
         self.db_session = db_session
 
-    async def get_city_by_id(self, city_id: int) -> City:
-        logger.info(f"Getting city by id {city_id}")
-        try:
-            city_orm = await self._get_city_orm(CityORM.id == city_id)
-        except CityNotFoundError:
-            raise CityNotFoundError(f"City with id {city_id} not found")
-        return self._convert_orm_to_city(city_orm)
+    async def get_city_by_id(self, city_id: int,
+                             with_weather: bool = True) -> City:
+        logger.info("Getting city by id %s", city_id)
+        return await self._get_city(
+            lambda: city_cache.get_by_id(city_id), CityORM.id == city_id,
+            with_weather=with_weather,
+            not_found_message=f"City with id {city_id} not found")
+
+    async def get_city_by_name(self, city_name: str,
+                               with_weather: bool = True) -> City:
+        logger.info("Getting city by name %s", city_name)
+        return await self._get_city(
+            lambda: city_cache.get_by_name(city_name),
+            CityORM.name == city_name,
+            with_weather=with_weather,
+            not_found_message=f"City with name {city_name} not found")
 
-    async def get_city_by_name(self, city_name: str) -> City:
-        logger.info(f"Getting city by name {city_name}")
+    async def get_city_by_coord(self, coordinates: Coordinates,
+                                with_weather: bool = True) -> City:
+        logger.info("Getting city by coordinates %s", coordinates)
+        return await self._get_city(
+            lambda: city_cache.get_by_coord(coordinates),
+            CityORM.latitude == coordinates.latitude,
+            CityORM.longitude == coordinates.longitude,
+            with_weather=with_weather,
+            not_found_message=f"City with coordinates {coordinates}"
+                              f" not found")
+
+    async def get_nearest_city(self, coordinates: Coordinates,
+                               max_distance_km: float,
+                               with_weather: bool = True) -> City:
+        """Ближайший к координатам отслеживаемый город
+        в радиусе max_distance_km (по пространственному индексу)."""
+        logger.info("Getting nearest city to coordinates %s within %s km",
+                    coordinates, max_distance_km)
+        city_id = self.get_nearest_city_id(coordinates, max_distance_km)
+        if city_id is None:
+            raise CityNotFoundError(f"City near coordinates {coordinates}"
+                                    f" not found")
         try:
-            city_orm = await self._get_city_orm(CityORM.name == city_name)
+            return await self.get_city_by_id(city_id,
+                                             with_weather=with_weather)
         except CityNotFoundError:
+            city_spatial_index.remove(city_id)
+            raise
+
+    @staticmethod
+    def get_nearest_city_id(coordinates: Coordinates,
+                            max_distance_km: float) -> int | None:
+        """ID ближайшего к координатам отслеживаемого города в радиусе
+        max_distance_km (без обращения к БД)."""
+        nearest = city_spatial_index.nearest(coordinates, max_distance_km)
+        return None if nearest is None else nearest[0]
+
+    async def get_city_data_version(
+            self, city_name: str) -> tuple[int, DataVersion]:
+        """
+        ID города и версия его погодных данных (без загрузки погодных
+        записей): из кэша городов или одним запросом к таблице версий.
+        """
+        city = city_cache.get_by_name(city_name)
+        if city is not None:
+            return city.id, DataVersion(f"{city.id}-{city.version}",
+                                        city.updated_at)
+        logger.info("Getting data version of city %s", city_name)
+        result = await self.db_session.execute(
+            select(CityORM.id, CityDataVersionORM.version,
+                   CityDataVersionORM.updated_at)
+            .outerjoin(CityDataVersionORM)
+            .where(CityORM.name == city_name)
+        )
+        row = result.first()
+        if row is None:
             raise CityNotFoundError(f"City with name {city_name} not found")
-        return self._convert_orm_to_city(city_orm)
+        return row.id, DataVersion(f"{row.id}-{row.version or 0}",
+                                   row.updated_at)
 
-    async def get_city_by_coord(self, coordinates: Coordinates) -> City:
-        logger.info(f"Getting city by coordinates {coordinates}")
-        try:
-            city_orm = await self._get_city_orm(
-                and_(
-                    CityORM.latitude == coordinates.latitude,
-                    CityORM.longitude == coordinates.longitude
-                )
-            )
-        except CityNotFoundError:
-            raise CityNotFoundError(f"City with coordinates {coordinates}"
-                                    f" not found")
-        return self._convert_orm_to_city(city_orm)
+    async def get_cities_data_version(self, after_id: int | None = None,
+                                      limit: int | None = None
+                                      ) -> DataVersion:
+        """
+        Версия страницы списка городов: количество и максимальный ID
+        городов (добавление) и сумма версий их погодных данных
+        (изменение погоды) - одним агрегирующим запросом.
+        """
+        logger.info("Getting data version of cities")
+        page = self._paginate(
+            select(CityORM.id, CityDataVersionORM.version,
+                   CityDataVersionORM.updated_at)
+            .outerjoin(CityDataVersionORM),
+            after_id, limit
+        ).subquery()
+        result = await self.db_session.execute(
+            select(func.count(), func.max(page.c.id),
+                   func.sum(page.c.version), func.max(page.c.updated_at))
+        )
+        count, max_id, versions, updated_at = result.one()
+        return DataVersion(f"{count}-{max_id or 0}-{versions or 0}",
+                           updated_at)
+
+    async def get_data_versions(self,
+                                city_ids: Iterable[int]) -> dict[int, int]:
+        """Версии погодных данных городов по ID (города без версии
+        пропускаются)."""
+        result = await self.db_session.execute(
+            select(CityDataVersionORM.city_id, CityDataVersionORM.version)
+            .where(CityDataVersionORM.city_id.in_(list(city_ids)))
+        )
+        return {row.city_id: row.version for row in result}
+
+    async def get_cities_by_ids_or_names(
+            self, city_ids: Iterable[int],
+            names: Iterable[str]) -> list[City]:
+        """
+        Города с погодой по ID или названиям (ненайденные пропускаются).
+        Города из кэша городов берутся из него, остальные читаются из БД
+        одним запросом и добавляются в кэш.
+        """
+        cities: dict[int, City] = {}
+        missing_ids: list[int] = []
+        missing_names: list[str] = []
+        for city_id in set(city_ids):
+            city = city_cache.get_by_id(city_id)
+            if city is None:
+                missing_ids.append(city_id)
+            else:
+                cities[city.id] = city
+        for name in set(names):
+            city = city_cache.get_by_name(name)
+            if city is None:
+                missing_names.append(name)
+            else:
+                cities[city.id] = city
+        if not missing_ids and not missing_names:
+            return list(cities.values())
+
+        logger.info("Getting %s cities by id and %s by name",
+                    len(missing_ids), len(missing_names))
+        generation = city_cache.generation()
+        result = await self.db_session.execute(
+            select(CityORM).options(selectinload(CityORM.weather_records))
+            .where(or_(CityORM.id.in_(missing_ids),
+                       CityORM.name.in_(missing_names)))
+        )
+        for city_orm in result.scalars():
+            city = self._convert_orm_to_city(city_orm)
+            city_cache.put(city, generation)
+            cities[city.id] = city
+        return list(cities.values())
+
+    async def rebuild_spatial_index(self) -> None:
+        """Заполняет пространственный индекс городами из БД."""
+        cities = await self.get_cities_without_weather()
+        city_spatial_index.rebuild(
+            (city.id, city.coordinates) for city in cities)
+        logger.info("Spatial index rebuilt for %s cities", len(cities))
+
+    async def refresh_spatial_index(self, cities_count: int) -> None:
+        """
+        Перестраивает пространственный индекс, если в БД есть города,
+        которых в нем нет (добавленные другими процессами).
+        Города не удаляются, поэтому достаточно сравнить их количество
+        в БД (cities_count) и в индексе.
+        """
+        if cities_count != len(city_spatial_index):
+            await self.rebuild_spatial_index()
+
+    async def get_cities_count(self) -> int:
+        """Количество городов в БД (города не удаляются, поэтому оно
+        меняется только при добавлении городов)."""
+        cities_count = await self.db_session.scalar(
+            select(func.count()).select_from(CityORM))
+        return cities_count or 0
 
-    async def get_cities(self) -> list[City]:
+    async def get_cities(self, after_id: int | None = None,
+                         limit: int | None = None) -> list[City]:
+        """Список городов с погодой, упорядоченный по ID.
+        Постраничный вывод - города с ID больше after_id, не более limit."""
         logger.info("Getting all cities")
-        result = await self.db_session.execute(self._get_select_cities_query())
-        cities_orm = result.unique().scalars().all()
+        query = self._paginate(
+            select(CityORM).options(selectinload(CityORM.weather_records)),
+            after_id, limit
+        )
+        result = await self.db_session.execute(query)
+        cities_orm = result.scalars().all()
         return [self._convert_orm_to_city(city_orm) for city_orm in cities_orm]
 
-    async def get_city_names(self) -> list[str]:
+    async def stream_cities(self, after_id: int | None = None,
+                            limit: int | None = None,
+                            chunk_size: int = 100) -> AsyncIterator[City]:
+        """
+        Потоковое чтение городов с погодой через серверный курсор.
+        Города загружаются порциями по chunk_size; карта идентичности сессии
+        хранит слабые ссылки, поэтому обработанные порции не копятся в памяти.
+        """
+        logger.info("Streaming all cities")
+        query = self._paginate(
+            select(CityORM).options(selectinload(CityORM.weather_records)),
+            after_id, limit
+        ).execution_options(yield_per=chunk_size)
+        result = await self.db_session.stream(query)
+        async for partition in result.scalars().partitions():
+            for city_orm in partition:
+                yield self._convert_orm_to_city(city_orm)
+
+    async def get_cities_without_weather(
+            self, shard_count: int | None = None,
+            shards: set[int] | None = None) -> list[City]:
+        """
+        Список городов без загрузки погодных записей.
+        С shard_count и shards - только города этих шардов
+        (шард города - ID города по модулю shard_count).
+        """
+        logger.info("Getting cities without weather")
+        query = select(CityORM.id, CityORM.name,
+                       CityORM.latitude, CityORM.longitude)
+        if shard_count is not None and shards is not None:
+            query = query.where((CityORM.id % shard_count).in_(shards))
+        result = await self.db_session.execute(query)
+        return [
+            City(id=row.id, name=row.name,
+                 coordinates=Coordinates(latitude=row.latitude,
+                                         longitude=row.longitude),
+                 weather_records=WeatherSeries())
+            for row in result
+        ]
+
+    async def get_weather_record_nearest_to_time(
+            self, city_id: int, time: datetime,
+            fields: tuple[str, ...] = WEATHER_FIELDS) -> Row:
+        """
+        Запись о погоде города, ближайшая к указанному времени.
+        Две ограниченные выборки по индексу (city_id, time): последняя запись
+        не позже time и первая запись позже time.
+        Из БД читаются только время и параметры fields - возвращается
+        строка результата только с ними.
+        """
+        logger.info("Getting weather record for city ID %s nearest to %s",
+                    city_id, time)
+        query = self._get_select_weather_query(city_id, fields)
+        before = await self.db_session.execute(
+            query.where(WeatherORM.time <= time)
+            .order_by(WeatherORM.time.desc()).limit(1)
+        )
+        after = await self.db_session.execute(
+            query.where(WeatherORM.time > time)
+            .order_by(WeatherORM.time.asc()).limit(1)
+        )
+        candidates = [row for row in (before.first(), after.first())
+                      if row is not None]
+        if not candidates:
+            raise WeatherInCityNotFoundError(
+                f"City with id {city_id} doesn't have any weather records")
+        return min(candidates, key=lambda row: abs(row.time - time))
+
+    async def get_weather_records_in_range(
+            self, city_id: int, start: datetime, end: datetime,
+            fields: tuple[str, ...] = WEATHER_FIELDS) -> WeatherSeries:
+        """Записи о погоде города в диапазоне времени [start, end]
+        (выборка по индексу (city_id, time)).
+        Из БД читаются только время и параметры fields."""
+        logger.info("Getting weather records for city ID %s from %s to %s",
+                    city_id, start, end)
+        result = await self.db_session.execute(
+            self._get_select_weather_query(city_id, fields)
+            .where(WeatherORM.time.between(start, end))
+            .order_by(WeatherORM.time)
+        )
+        return WeatherSeries.from_records(result.all())
+
+    async def get_city_names(self, after_id: int | None = None,
+                             limit: int | None = None) -> list[str]:
         logger.info("Getting all city names")
-        result = await self.db_session.execute(select(CityORM.name))
+        result = await self.db_session.execute(
+            self._paginate(select(CityORM.name), after_id, limit))
         return list(result.scalars())
 
+    async def stream_city_names(self, after_id: int | None = None,
+                                limit: int | None = None,
+                                chunk_size: int = 1000
+                                ) -> AsyncIterator[str]:
+        """Потоковое чтение названий городов через серверный курсор."""
+        logger.info("Streaming all city names")
+        result = await self.db_session.stream_scalars(
+            self._paginate(select(CityORM.name), after_id, limit)
+            .execution_options(yield_per=chunk_size)
+        )
+        async for city_name in result:
+            yield city_name
+
     async def save_city(self, city: City) -> City:
-        logger.info(f"Saving city {city.name}")
+        logger.info("Saving city %s", city.name)
+        updated_at = utc_now()
         async with transaction(self.db_session):
             city_orm = CityORM(
                 name=city.name,
                 latitude=city.coordinates.latitude,
                 longitude=city.coordinates.longitude,
-                weather_records=[WeatherORM(**weather.model_dump())
-                                 for weather in (city.weather_records or [])]
+                weather_records=[WeatherORM(**row)
+                                 for row in city.weather_records.rows()],
+                data_version=CityDataVersionORM(version=1,
+                                                updated_at=updated_at,
+                                                refreshed_at=updated_at)
             )
             self.db_session.add(city_orm)
 
-        return self._convert_orm_to_city(city_orm)
+        saved_city = self._convert_orm_to_city(city_orm)
+        city_spatial_index.add(saved_city.id, saved_city.coordinates)
+        city_cache.replace(saved_city)
+        return saved_city
+
+    async def find_existing_cities(
+            self, names: list[str], coordinates: list[Coordinates],
+            chunk_size: int = 500
+    ) -> tuple[set[str], set[tuple[float, float]]]:
+        """
+        Имена и координаты (широта, долгота) городов в БД, совпадающие
+        с переданными. Проверка выполняется одним запросом на каждые
+        chunk_size имен и координат (число параметров запроса ограничено).
+        """
+        logger.info("Checking %s names and %s coordinates for existing "
+                    "cities", len(names), len(coordinates))
+        existing_names: set[str] = set()
+        existing_coordinates: set[tuple[float, float]] = set()
+        pairs = [(point.latitude, point.longitude) for point in coordinates]
+        for start in range(0, max(len(names), len(pairs)), chunk_size):
+            result = await self.db_session.execute(
+                select(CityORM.name, CityORM.latitude, CityORM.longitude)
+                .where(or_(
+                    CityORM.name.in_(names[start:start + chunk_size]),
+                    tuple_(CityORM.latitude, CityORM.longitude)
+                    .in_(pairs[start:start + chunk_size])
+                ))
+                # Проверка перед вставкой - без задержки реплики
+                .execution_options(use_primary=True)
+            )
+            for row in result:
+                existing_names.add(row.name)
+                existing_coordinates.add((row.latitude, row.longitude))
+        return existing_names, existing_coordinates
+
+    async def save_cities(self, cities: list[City]) -> list[City]:
+        """
+        Сохраняет города с погодными записями одной транзакцией:
+        один INSERT ... RETURNING для городов и пакетные INSERT
+        для всех погодных записей и версий данных.
+        """
+        logger.info("Saving %s cities", len(cities))
+        if not cities:
+            return []
+        updated_at = utc_now()
+        async with transaction(self.db_session):
+            result = await self.db_session.execute(
+                insert(CityORM.__table__).returning(
+                    CityORM.__table__.c.id, sort_by_parameter_order=True),
+                [{"name": city.name,
+                  "latitude": city.coordinates.latitude,
+                  "longitude": city.coordinates.longitude}
+                 for city in cities]
+            )
+            city_ids = list(result.scalars())
+            weather_rows = [
+                {**row, "city_id": city_id}
+                for city, city_id in zip(cities, city_ids)
+                for row in city.weather_records.rows()
+            ]
+            if weather_rows:
+                await self.db_session.execute(
+                    insert(WeatherORM.__table__), weather_rows)
+            await self.db_session.execute(
+                insert(CityDataVersionORM.__table__),
+                [{"city_id": city_id, "version": 1, "updated_at": updated_at,
+                  "refreshed_at": updated_at}
+                 for city_id in city_ids]
+            )
+
+        saved_cities = [
+            city.model_copy(update={"id": city_id, "version": 1,
+                                    "updated_at": updated_at,
+                                    "refreshed_at": updated_at})
+            for city, city_id in zip(cities, city_ids)]
+        for city in saved_cities:
+            city_spatial_index.add(city.id, city.coordinates)
+        return saved_cities
 
     async def update_weather_records(
             self, city_id: int,
-            new_weather_records: list[Weather]) -> None:
+            new_weather_records: WeatherSeries) -> CityWeatherUpdate:
         """
         Обновляет погодные записи для города с заданным ID.
         Имеющиеся записи обновляются, а тех, которых нет - добавляются.
+        Выполняется одним INSERT ... ON CONFLICT (city_id, time) DO UPDATE
+        ... RETURNING для всех записей, неизменившиеся записи
+        не перезаписываются и не возвращаются.
+        Если записи изменились, в той же транзакции увеличивается версия
+        погодных данных города, иначе отмечается только время обновления
+        прогноза.
+        Возвращает добавленные и измененные записи и версию данных
+        (без изменений - пустой ряд и версию 0).
         """
-        city_orm = await self._get_city_orm(CityORM.id == city_id)
-        existing_records = {record.time: record for record
-                            in city_orm.weather_records}
+        logger.info("Updating %s weather records for city ID %s",
+                    len(new_weather_records), city_id)
+        city_exists = await self.db_session.scalar(
+            select(CityORM.id).where(CityORM.id == city_id))
+        if city_exists is None:
+            raise CityNotFoundError(f"City with id {city_id} not found")
+        if not new_weather_records:
+            return CityWeatherUpdate(city_id, 0, WeatherSeries())
+
+        rows = [{**row, "city_id": city_id}
+                for row in new_weather_records.rows()]
+        version = 0
         async with transaction(self.db_session):
-            for weather in new_weather_records:
-                if weather.time in existing_records:
-                    self._update_record(weather,
-                                        existing_records[weather.time])
-                else:
-                    self._add_record(weather, city_id)
-
-    def _update_record(self, new_weather: Weather,
-                       existing_record: WeatherORM) -> None:
-        logger.debug(f"Updating weather record for city ID "
-                     f"{existing_record.city_id} at time "
-                     f"{existing_record.time}")
-        # Сравниваем только те поля, которые могут изменяться
-        updated_data = {key: value for key, value in
-                        new_weather.model_dump().items()
-                        if getattr(existing_record, key) != value}
-
-        # Если есть изменения, обновляем только изменённые поля
-        if updated_data:
-            for key, value in updated_data.items():
-                setattr(existing_record, key, value)
-
-    def _add_record(self, new_weather: Weather, city_id: int) -> None:
-        logger.debug(f"Adding new weather record for city ID {city_id} "
-                     f"at time {new_weather.time}")
-        new_record = WeatherORM(**new_weather.model_dump(),
-                                city_id=city_id)
-        self.db_session.add(new_record)
+            result = await self.db_session.execute(
+                self._get_upsert_weather_query(), rows)
+            changed_records = WeatherSeries.from_records(result.all())
+            if changed_records:
+                version = await self.db_session.scalar(
+                    self._get_bump_version_query(city_id))
+            else:
+                await self.db_session.execute(
+                    self._get_mark_refreshed_query([city_id]))
+        if changed_records:
+            # Город в кэше перечитывается из БД при следующем запросе
+            city_cache.invalidate(city_id)
+        return CityWeatherUpdate(city_id, version, changed_records)
+
+    async def mark_weather_refreshed(self, city_ids: list[int]) -> None:
+        """
+        Отмечает время обновления прогноза городов, прогноз которых
+        не изменился и не записывался в БД, - одним UPDATE для всех
+        городов.
+        """
+        if not city_ids:
+            return
+        logger.info("Marking weather of %s cities as refreshed",
+                    len(city_ids))
+        async with transaction(self.db_session):
+            await self.db_session.execute(
+                self._get_mark_refreshed_query(city_ids))
+
+    def _get_upsert_weather_query(self) -> Insert:
+        """
+        Возвращает INSERT ... ON CONFLICT (city_id, time) DO UPDATE
+        для диалекта текущей БД. Строка обновляется только если
+        хотя бы одно значение отличается от сохраненного; добавленные
+        и обновленные строки возвращаются (RETURNING).
+        """
+        table = WeatherORM.__table__
+        insert_query = get_upsert_insert(self.db_session, table)
+        return insert_query.on_conflict_do_update(
+            index_elements=[table.c.city_id, table.c.time],
+            set_={name: insert_query.excluded[name]
+                  for name in WEATHER_FIELDS},
+            where=or_(*(
+                table.c[name].is_distinct_from(insert_query.excluded[name])
+                for name in WEATHER_FIELDS
+            ))
+        ).returning(table.c.time,
+                    *(table.c[name] for name in WEATHER_FIELDS))
+
+    def _get_bump_version_query(self, city_id: int) -> Insert:
+        """
+        Увеличивает версию погодных данных города, время изменения
+        и обновления прогноза (версия создается для городов, добавленных
+        без нее). Возвращает новую версию.
+        """
+        table = CityDataVersionORM.__table__
+        now = utc_now()
+        insert_query = get_upsert_insert(self.db_session, table).values(
+            city_id=city_id, version=1, updated_at=now, refreshed_at=now)
+        return insert_query.on_conflict_do_update(
+            index_elements=[table.c.city_id],
+            set_={"version": table.c.version + 1,
+                  "updated_at": insert_query.excluded.updated_at,
+                  "refreshed_at": insert_query.excluded.refreshed_at}
+        ).returning(table.c.version)
+
+    @staticmethod
+    def _get_mark_refreshed_query(city_ids: list[int]) -> Update:
+        """Отмечает время обновления прогноза городов без изменения
+        версии и времени изменения погодных данных."""
+        return (update(CityDataVersionORM.__table__)
+                .where(CityDataVersionORM.city_id.in_(city_ids))
+                .values(refreshed_at=utc_now()))
 
     @staticmethod
     def _get_select_cities_query() -> Select:
-        """Возвращает базовый запрос для CityORM
-        с предзагрузкой weather_records."""
-        return select(CityORM).options(joinedload(CityORM.weather_records))
+        """Возвращает базовый запрос для CityORM с предзагрузкой
+        weather_records отдельным запросом (без повторения колонок
+        города в каждой строке погоды)."""
+        return select(CityORM).options(selectinload(CityORM.weather_records))
 
-    async def _get_city_orm(self, *where_clauses) -> CityORM:
-        query = self._get_select_cities_query().where(*where_clauses)
+    @staticmethod
+    def _paginate(query: Select, after_id: int | None,
+                  limit: int | None) -> Select:
+        """Keyset-пагинация по ID города."""
+        query = query.order_by(CityORM.id)
+        if after_id is not None:
+            query = query.where(CityORM.id > after_id)
+        if limit is not None:
+            query = query.limit(limit)
+        return query
+
+    @staticmethod
+    def _get_select_weather_query(
+            city_id: int, fields: tuple[str, ...] = WEATHER_FIELDS) -> Select:
+        """Возвращает запрос времени и колонок fields погодных записей
+        города."""
+        return select(
+            WeatherORM.time,
+            *(getattr(WeatherORM, name) for name in fields)
+        ).where(WeatherORM.city_id == city_id)
+
+    async def _get_city(self, get_cached: Callable[[], City | None],
+                        *where_clauses, with_weather: bool,
+                        not_found_message: str) -> City:
+        """
+        Город берется из кэша городов (вместе с погодой), а при промахе
+        читается из БД. Город с погодой после чтения добавляется в кэш;
+        город без погоды читается без погодных записей - их можно
+        выбрать по индексу (get_weather_record_nearest_to_time).
+        """
+        city = get_cached()
+        if city is not None:
+            return city
+        generation = city_cache.generation()
+        try:
+            city_orm = await self._get_city_orm(*where_clauses,
+                                                with_weather=with_weather)
+        except CityNotFoundError:
+            raise CityNotFoundError(not_found_message)
+        city = self._convert_orm_to_city(city_orm)
+        if with_weather:
+            city_cache.put(city, generation)
+        return city
+
+    async def _get_city_orm(self, *where_clauses,
+                            with_weather: bool = True) -> CityORM:
+        if with_weather:
+            query = self._get_select_cities_query()
+        else:
+            query = select(CityORM).options(noload(CityORM.weather_records))
+        query = query.where(*where_clauses)
         result = await self.db_session.execute(query)
         city_orm = result.scalars().first()
         if city_orm is None:
@@ -128,18 +578,21 @@ class CityRepository:
         return city_orm
 
     def _convert_orm_to_city(self, city_orm: CityORM) -> City:
-        """Конвертация CityORM в City с вложенными Weather"""
-        weather_records = [
-            Weather.model_validate(weather_record, from_attributes=True)
-            for weather_record in city_orm.weather_records
-        ]
+        """Конвертация CityORM в City с рядом погодных записей"""
+        weather_records = WeatherSeries.from_records(city_orm.weather_records)
         coordinates = Coordinates(
             latitude=city_orm.latitude,
             longitude=city_orm.longitude
         )
+        # Город без версии добавлен до появления таблицы версий
+        data_version = city_orm.data_version
         return City(
             id=city_orm.id,
             name=city_orm.name,
             coordinates=coordinates,
-            weather_records=weather_records
+            weather_records=weather_records,
+            version=(data_version.version or 0) if data_version else 0,
+            updated_at=data_version.updated_at if data_version else None,
+            refreshed_at=(data_version.refreshed_at if data_version
+                          else None)
         )
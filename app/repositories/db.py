@@ -1,26 +1,205 @@
+import time
 from contextlib import asynccontextmanager
-from typing import AsyncGenerator
+from typing import Any, AsyncGenerator
 
+from sqlalchemy import (Connection, Index, Table, delete, event, func,
+                        inspect, select)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.asyncio import (AsyncEngine, AsyncSession,
-                                    create_async_engine)
+                                    async_sessionmaker, create_async_engine)
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.sql.base import Executable
+from sqlalchemy.sql.dml import UpdateBase
 
-from app.utils.log import logger
+from app import config
+from app.utils.exceptions import DatabaseConfigError
+from app.utils.log import get_logger
+from app.utils.metrics import DB_LATENCY_BUCKETS, Counter, Histogram
 
-DATABASE_URL = "sqlite+aiosqlite:///./weather.db"
+logger = get_logger(__name__)
 
-engine: AsyncEngine = create_async_engine(DATABASE_URL, echo=False)
-AsyncSessionLocal = sessionmaker(engine, class_=AsyncSession,
-                                 expire_on_commit=False)
+db_statement_duration = Histogram(
+    "db_statement_duration_seconds",
+    "Database statement execution time",
+    ("engine", "statement"), buckets=DB_LATENCY_BUCKETS)
+db_statement_errors = Counter(
+    "db_statement_errors_total",
+    "Failed database statements", ("engine",))
+
+STATEMENT_KINDS = ("SELECT", "INSERT", "UPDATE", "DELETE")
+# Диалекты, для которых есть upsert и выражения начала часа и дня
+SUPPORTED_DIALECTS = ("postgresql", "sqlite")
+
+DATABASE_URL = config.DATABASE_URL
+DATABASE_READ_URL = config.DATABASE_READ_URL
+
+
+def _is_sqlite(url: str) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+
+def _set_sqlite_pragmas(dbapi_connection, query_only: bool) -> None:
+    """
+    Настройка соединения SQLite: WAL позволяет читать параллельно с записью,
+    synchronous=NORMAL в режиме WAL не теряет целостность при сбое процесса.
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={config.SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA mmap_size={config.SQLITE_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA cache_size={config.SQLITE_CACHE_SIZE}")
+    if query_only:
+        cursor.execute("PRAGMA query_only=ON")
+    cursor.close()
+
+
+def _check_dialect(url: str) -> None:
+    """Неподдерживаемый диалект отклоняется при запуске, а не при первом
+    upsert или агрегации истории."""
+    dialect_name = make_url(url).get_backend_name()
+    if dialect_name not in SUPPORTED_DIALECTS:
+        raise DatabaseConfigError(
+            f"Database dialect '{dialect_name}' is not supported, "
+            f"use one of: {', '.join(SUPPORTED_DIALECTS)}")
+
+
+def _create_engine(url: str, readonly: bool = False) -> AsyncEngine:
+    _check_dialect(url)
+    if not _is_sqlite(url):
+        return create_async_engine(
+            url, echo=config.DB_ECHO,
+            pool_size=config.DB_POOL_SIZE,
+            max_overflow=config.DB_MAX_OVERFLOW,
+            pool_timeout=config.DB_POOL_TIMEOUT,
+            pool_recycle=config.DB_POOL_RECYCLE,
+            pool_pre_ping=True,
+        )
+
+    # SQLite допускает только одного писателя, поэтому запись идет через
+    # единственное соединение, а чтение - через пул соединений
+    pool_size = config.DB_POOL_SIZE if readonly else 1
+    sqlite_engine = create_async_engine(
+        url, echo=config.DB_ECHO,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=pool_size,
+        max_overflow=config.DB_MAX_OVERFLOW if readonly else 0,
+        pool_timeout=config.DB_POOL_TIMEOUT,
+    )
+
+    @event.listens_for(sqlite_engine.sync_engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        _set_sqlite_pragmas(dbapi_connection, query_only=readonly)
+
+    return sqlite_engine
+
+
+def _get_statement_kind(statement: str) -> str:
+    kind = statement[:6].upper()
+    return kind if kind in STATEMENT_KINDS else "OTHER"
+
+
+def _instrument_engine(async_engine: AsyncEngine, name: str) -> None:
+    """Сбор времени выполнения запросов движка через события SQLAlchemy."""
+    sync_engine = async_engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters,
+                              context, executemany):
+        context.metrics_start_time = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters,
+                             context, executemany):
+        db_statement_duration.labels(
+            name, _get_statement_kind(statement)
+        ).observe(time.perf_counter() - context.metrics_start_time)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(exception_context):
+        db_statement_errors.labels(name).inc()
+
+
+engine: AsyncEngine = _create_engine(DATABASE_URL)
+_instrument_engine(engine, "main")
+# Для SQLite чтение всегда идет через отдельный движок
+if DATABASE_READ_URL != DATABASE_URL or _is_sqlite(DATABASE_URL):
+    read_engine: AsyncEngine = _create_engine(DATABASE_READ_URL,
+                                              readonly=True)
+    _instrument_engine(read_engine, "read")
+else:
+    read_engine = engine
+
+
+class RoutingSession(Session):
+    """
+    Сессия, направляющая запись (flush, INSERT/UPDATE/DELETE) в engine,
+    а чтение - в read_engine. Запросы с execution_options(use_primary=True)
+    (чтение, которому нельзя отставать от записи) также идут в engine.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kwargs: Any) -> Engine:
+        if (self._flushing or isinstance(clause, UpdateBase)
+                or (isinstance(clause, Executable)
+                    and clause.get_execution_options().get("use_primary"))):
+            return engine.sync_engine
+        return read_engine.sync_engine
+
+
+AsyncSessionLocal = async_sessionmaker(sync_session_class=RoutingSession,
+                                       expire_on_commit=False)
 Base = declarative_base()
 
 
-async def create_tables():
-    """Создает таблицы в базе данных асинхронно."""
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-        logger.info("Database tables created successfully")
+async def create_tables(attempts: int = 3):
+    """
+    Создает таблицы в базе данных асинхронно.
+    При одновременном запуске нескольких процессов таблицу может успеть
+    создать другой процесс - тогда создание повторяется (с проверкой
+    существующих таблиц).
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+                # create_all не добавляет индексы в уже существующие таблицы
+                for table in Base.metadata.sorted_tables:
+                    for index in table.indexes:
+                        await conn.run_sync(_create_missing_index, index)
+            break
+        except DBAPIError as e:
+            if attempt == attempts:
+                raise
+            logger.warning("Failed to create tables, retrying: %s", e)
+    logger.info("Database tables created successfully")
+
+
+def _create_missing_index(connection: Connection, index: Index) -> None:
+    """
+    Создает индекс, которого нет в существующей таблице.
+    Перед созданием уникального индекса удаляются строки-дубликаты
+    (остается последняя добавленная), которые могли появиться до него.
+    """
+    table = index.table
+    if table is None:
+        return
+    existing_indexes = inspect(connection).get_indexes(table.name)
+    if any(existing["name"] == index.name for existing in existing_indexes):
+        return
+    if index.unique and "id" in table.c:
+        latest_ids = (select(func.max(table.c.id))
+                      .group_by(*index.columns).scalar_subquery())
+        result = connection.execute(
+            delete(table).where(table.c.id.not_in(latest_ids)))
+        if result.rowcount:
+            logger.warning("Deleted %s duplicate rows from %s before "
+                           "creating unique index %s", result.rowcount,
+                           table.name, index.name)
+    index.create(connection)
 
 
 @asynccontextmanager
@@ -48,5 +227,18 @@ async def transaction(session: AsyncSession):
         logger.debug("Transaction committed successfully")
     except Exception as e:
         await session.rollback()
-        logger.error(f"Transaction rolled back due to error: {e}")
+        logger.error("Transaction rolled back due to error: %s", e)
         raise e
+
+
+def get_upsert_insert(
+        session: AsyncSession,
+        table: Table | type) -> postgresql.Insert | sqlite.Insert:
+    """
+    INSERT с поддержкой ON CONFLICT (upsert) для диалекта БД сессии.
+    table - таблица или ORM-модель.
+    """
+    # Другие диалекты отклоняются при создании движка (SUPPORTED_DIALECTS)
+    if session.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(table)
+    return sqlite.insert(table)
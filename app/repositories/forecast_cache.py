@@ -0,0 +1,171 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, NamedTuple
+
+from app import config
+from app.schemas.coordinates import Coordinates
+from app.schemas.weather_series import WeatherSeries
+from app.utils.log import get_logger
+from app.utils.metrics import CallbackMetric
+
+logger = get_logger(__name__)
+
+CacheKey = tuple[float, float]
+
+# Шаг сетки minutely_15 у Open-Meteo (сек)
+FORECAST_GRID_SECONDS = 15 * 60
+
+
+class CachedForecast(NamedTuple):
+    """Прогноз из кэша и признак того, что он устарел."""
+    weather_records: WeatherSeries
+    stale: bool = False
+
+
+class ForecastCache:
+    """
+    LRU-кэш прогнозов Open-Meteo по координатам.
+    Записи актуальны до следующего шага 15-минутной сетки, одновременные
+    промахи по одному ключу объединяются в один запрос к API.
+    Устаревшая запись еще stale_ttl секунд отдается с пометкой stale,
+    пока прогноз обновляется в фоне (stale-while-revalidate).
+    """
+
+    def __init__(self, max_size: int, stale_ttl: float = 0.0,
+                 precision: int = 4):
+        self.max_size = max_size
+        self.stale_ttl = stale_ttl
+        self.precision = precision
+        # Ключ -> (актуальна до, отдается до, прогноз)
+        self._entries: OrderedDict[
+            CacheKey, tuple[float, float, WeatherSeries]] = OrderedDict()
+        self._in_flight: dict[CacheKey, asyncio.Task] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def make_key(self, coordinates: Coordinates) -> CacheKey:
+        return (round(coordinates.latitude, self.precision),
+                round(coordinates.longitude, self.precision))
+
+    @staticmethod
+    def _expires_at(now: float) -> float:
+        """Время начала следующего 15-минутного шага прогноза."""
+        return (now // FORECAST_GRID_SECONDS + 1) * FORECAST_GRID_SECONDS
+
+    def get(self, coordinates: Coordinates) -> WeatherSeries | None:
+        """Актуальный прогноз из кэша."""
+        entry = self._get_entry(self.make_key(coordinates))
+        if entry is None or entry[0] <= time.time():
+            return None
+        return entry[2]
+
+    def _get_entry(self, key: CacheKey
+                   ) -> tuple[float, float, WeatherSeries] | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, coordinates: Coordinates,
+            weather_records: WeatherSeries) -> None:
+        key = self.make_key(coordinates)
+        expires_at = self._expires_at(time.time())
+        self._entries[key] = (expires_at, expires_at + self.stale_ttl,
+                              weather_records)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def get_or_fetch(
+        self, coordinates: Coordinates,
+        fetch: Callable[[], Awaitable[WeatherSeries]]
+    ) -> CachedForecast:
+        """
+        Возвращает прогноз из кэша, а при промахе запрашивает его через fetch.
+        Если запрос по этим координатам уже выполняется - ожидает его.
+        Устаревший прогноз возвращается сразу с пометкой stale,
+        а новый запрашивается в фоне.
+        """
+        key = self.make_key(coordinates)
+        entry = self._get_entry(key)
+        if entry is not None:
+            expires_at, _, weather_records = entry
+            if expires_at > time.time():
+                self.hits += 1
+                logger.debug("Forecast cache hit for %s", coordinates)
+                return CachedForecast(weather_records)
+            self.stale_hits += 1
+            logger.debug("Serving stale forecast for %s", coordinates)
+            self._start_fetch(key, coordinates, fetch)
+            return CachedForecast(weather_records, stale=True)
+
+        if key in self._in_flight:
+            self.coalesced += 1
+            logger.debug("Forecast request coalesced for %s", coordinates)
+        else:
+            self.misses += 1
+        task = self._start_fetch(key, coordinates, fetch)
+        # shield - отмена одного ожидающего не отменяет общий запрос
+        return CachedForecast(await asyncio.shield(task))
+
+    def _start_fetch(self, key: CacheKey, coordinates: Coordinates,
+                     fetch: Callable[[], Awaitable[WeatherSeries]]
+                     ) -> asyncio.Task:
+        """Запускает запрос прогноза, если он еще не выполняется."""
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(coordinates, fetch))
+            task.add_done_callback(self._on_fetch_done)
+            self._in_flight[key] = task
+        return task
+
+    async def _fetch(self, coordinates: Coordinates,
+                     fetch: Callable[[], Awaitable[WeatherSeries]]
+                     ) -> WeatherSeries:
+        try:
+            weather_records = await fetch()
+            self.put(coordinates, weather_records)
+            return weather_records
+        finally:
+            self._in_flight.pop(self.make_key(coordinates), None)
+
+    @staticmethod
+    def _on_fetch_done(task: asyncio.Task) -> None:
+        # Ошибку фонового обновления никто не ожидает - только логируем
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug("Forecast fetch failed: %s", task.exception())
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "in_flight": len(self._in_flight),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+        }
+
+
+forecast_cache = ForecastCache(max_size=config.FORECAST_CACHE_SIZE,
+                               stale_ttl=config.FORECAST_CACHE_STALE_TTL)
+
+CallbackMetric("forecast_cache_size", "Forecasts in the Open-Meteo cache",
+               "gauge", lambda: len(forecast_cache._entries))
+CallbackMetric("forecast_cache_hits_total", "Forecast cache hits",
+               "counter", lambda: forecast_cache.hits)
+CallbackMetric("forecast_cache_stale_hits_total",
+               "Stale forecasts served while refreshing in background",
+               "counter", lambda: forecast_cache.stale_hits)
+CallbackMetric("forecast_cache_misses_total", "Forecast cache misses",
+               "counter", lambda: forecast_cache.misses)
+CallbackMetric("forecast_cache_coalesced_total",
+               "Forecast requests joined to an in-flight request",
+               "counter", lambda: forecast_cache.coalesced)
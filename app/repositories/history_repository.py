@@ -0,0 +1,166 @@
+from datetime import datetime
+from typing import Any, Callable
+
+from sqlalchemy import delete, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.repositories.db import get_upsert_insert, transaction
+from app.repositories.models import (WeatherDailyORM, WeatherHourlyORM,
+                                     WeatherORM)
+from app.schemas.weather import WEATHER_FIELDS
+from app.schemas.weather_history import AGGREGATES, Resolution
+from app.utils.log import get_logger
+
+logger = get_logger(__name__)
+
+ROLLUP_MODELS: dict[Resolution, type[WeatherHourlyORM | WeatherDailyORM]] = {
+    Resolution.HOUR: WeatherHourlyORM,
+    Resolution.DAY: WeatherDailyORM,
+}
+
+# Начало часа и дня в формате хранения DateTime в SQLite
+_SQLITE_PERIOD_FORMATS = {
+    Resolution.HOUR: "%Y-%m-%d %H:00:00.000000",
+    Resolution.DAY: "%Y-%m-%d 00:00:00.000000",
+}
+
+
+class WeatherHistoryRepository:
+    """
+    История погоды: почасовые и суточные агрегаты 15-минутных записей
+    и удаление записей старше срока хранения.
+    Операции с shard_count и shards затрагивают только города этих шардов
+    (как в CityRepository.get_cities_without_weather).
+    """
+
+    def __init__(self, db_session: AsyncSession):
+        self.db_session = db_session
+
+    async def rollup(self, resolution: Resolution, start: datetime,
+                     end: datetime, shard_count: int | None = None,
+                     shards: set[int] | None = None) -> int:
+        """
+        Пересчитывает агрегаты по записям о погоде в диапазоне [start, end)
+        одним INSERT ... SELECT ... GROUP BY ... ON CONFLICT DO UPDATE.
+        start и end должны быть границами периодов resolution.
+        Возвращает количество добавленных и обновленных агрегатов.
+        """
+        logger.info("Rolling up weather (resolution=%s) from %s to %s",
+                    resolution.value, start, end)
+        model = ROLLUP_MODELS[resolution]
+        period_start = self._get_period_start(resolution, WeatherORM.time)
+        aggregates: dict[str, Callable[..., Any]] = {
+            "min": func.min, "max": func.max, "mean": func.avg
+        }
+        columns = {
+            "city_id": WeatherORM.city_id,
+            "period_start": period_start,
+            "samples": func.count(),
+            **{f"{name}_{aggregate}": aggregates[aggregate](
+                getattr(WeatherORM, name))
+               for name in WEATHER_FIELDS for aggregate in AGGREGATES},
+        }
+        query = (
+            select(*(column.label(name) for name, column in columns.items()))
+            .where(WeatherORM.time >= start, WeatherORM.time < end)
+            .group_by(WeatherORM.city_id, period_start)
+        )
+        if shard_count is not None and shards is not None:
+            query = query.where((WeatherORM.city_id % shard_count).in_(shards))
+
+        insert_query = get_upsert_insert(self.db_session, model)
+        insert_query = insert_query.from_select(list(columns), query)
+        async with transaction(self.db_session):
+            result = await self.db_session.execute(
+                insert_query.on_conflict_do_update(
+                    index_elements=["city_id", "period_start"],
+                    set_={name: insert_query.excluded[name]
+                          for name in list(columns)[2:]}
+                )
+            )
+        return max(result.rowcount, 0)
+
+    async def get_oldest_weather_time(
+            self, shard_count: int | None = None,
+            shards: set[int] | None = None) -> datetime | None:
+        """Время самой старой записи о погоде."""
+        query = select(func.min(WeatherORM.time))
+        if shard_count is not None and shards is not None:
+            query = query.where((WeatherORM.city_id % shard_count).in_(shards))
+        return await self.db_session.scalar(query)
+
+    async def delete_weather_records_before(
+            self, before: datetime, batch_size: int,
+            shard_count: int | None = None,
+            shards: set[int] | None = None) -> int:
+        """Удаляет записи о погоде старше before порциями по batch_size
+        строк. Возвращает количество удаленных записей."""
+        logger.info("Deleting weather records before %s", before)
+        return await self._delete_before(WeatherORM, WeatherORM.time, before,
+                                         batch_size, shard_count, shards)
+
+    async def delete_rollups_before(
+            self, resolution: Resolution, before: datetime, batch_size: int,
+            shard_count: int | None = None,
+            shards: set[int] | None = None) -> int:
+        """Удаляет агрегаты за периоды, начавшиеся раньше before,
+        порциями по batch_size строк."""
+        logger.info("Deleting weather rollups (resolution=%s) before %s",
+                    resolution.value, before)
+        model = ROLLUP_MODELS[resolution]
+        return await self._delete_before(model, model.period_start, before,
+                                         batch_size, shard_count, shards)
+
+    async def get_rollups(
+            self, city_id: int, resolution: Resolution, start: datetime,
+            end: datetime, fields: tuple[str, ...] = WEATHER_FIELDS
+    ) -> list[dict[str, Any]]:
+        """
+        Агрегаты города за периоды, начавшиеся в диапазоне [start, end].
+        Из БД читаются только начало периода, количество записей
+        и агрегаты параметров fields.
+        """
+        logger.info("Getting weather rollups (resolution=%s) for city ID %s "
+                    "from %s to %s", resolution.value, city_id, start, end)
+        model = ROLLUP_MODELS[resolution]
+        result = await self.db_session.execute(
+            select(model.period_start, model.samples,
+                   *(getattr(model, f"{name}_{aggregate}")
+                     for name in fields for aggregate in AGGREGATES))
+            .where(model.city_id == city_id,
+                   model.period_start.between(start, end))
+            .order_by(model.period_start)
+        )
+        return [row._asdict() for row in result]
+
+    async def _delete_before(self, model, time_column, before: datetime,
+                             batch_size: int, shard_count: int | None,
+                             shards: set[int] | None) -> int:
+        """
+        Удаляет строки с time_column < before отдельными транзакциями по
+        batch_size строк, чтобы надолго не блокировать запись в таблицу.
+        """
+        query = select(model.id).where(time_column < before)
+        if shard_count is not None and shards is not None:
+            query = query.where((model.city_id % shard_count).in_(shards))
+        deleted = 0
+        while True:
+            async with transaction(self.db_session):
+                result = await self.db_session.execute(
+                    delete(model)
+                    .where(model.id.in_(query.limit(batch_size)
+                                        .scalar_subquery()))
+                    .execution_options(synchronize_session=False)
+                )
+            deleted += max(result.rowcount, 0)
+            if result.rowcount < batch_size:
+                return deleted
+
+    def _get_period_start(self, resolution: Resolution, column):
+        """Выражение начала периода (часа или дня) для диалекта текущей
+        БД."""
+        # Другие диалекты отклоняются при создании движка
+        if self.db_session.get_bind().dialect.name == "postgresql":
+            return func.date_trunc(resolution.value, column)
+        return func.strftime(_SQLITE_PERIOD_FORMATS[resolution], column)
@@ -0,0 +1,43 @@
+import httpx
+
+from app import config
+from app.utils.log import get_logger
+
+logger = get_logger(__name__)
+
+_client: httpx.AsyncClient | None = None
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """Создает общий для процесса HTTP-клиент с пулом соединений."""
+    global _client
+    if _client is None:
+        logger.info("Creating shared HTTP client")
+        _client = httpx.AsyncClient(
+            timeout=config.HTTP_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=config.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=(
+                    config.HTTP_MAX_KEEPALIVE_CONNECTIONS),
+                keepalive_expiry=config.HTTP_KEEPALIVE_EXPIRY,
+            ),
+            http2=config.HTTP2,
+        )
+    return _client
+
+
+async def close_http_client() -> None:
+    """Закрывает общий HTTP-клиент и все соединения пула."""
+    global _client
+    if _client is not None:
+        logger.info("Closing shared HTTP client")
+        await _client.aclose()
+        _client = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Возвращает общий HTTP-клиент.
+       Используется как FastAPI dependency и для фоновых задач."""
+    if _client is None:
+        raise RuntimeError("HTTP client is not initialized")
+    return _client
@@ -0,0 +1,126 @@
+import math
+import random
+from datetime import datetime, timedelta
+from typing import cast
+
+from sqlalchemy import delete, func, or_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.repositories.db import get_upsert_insert, transaction
+from app.repositories.models import RefreshLeaseORM, RefreshWorkerORM
+from app.utils.dates import utc_now
+from app.utils.log import get_logger
+
+logger = get_logger(__name__)
+
+
+class LeaseRepository:
+    """
+    Аренды шардов фонового обновления погоды.
+    Каждый процесс отмечается в таблице активных процессов, продлевает
+    свои аренды и забирает свободные или истекшие, стремясь к равной доле
+    шардов среди активных процессов.
+    Время аренд - по часам процессов, поэтому часы узлов должны быть
+    синхронизированы с точностью много меньше lease_ttl.
+    """
+
+    def __init__(self, db_session: AsyncSession):
+        self.db_session = db_session
+
+    async def ensure_shards(self, shard_count: int) -> None:
+        """Создает недостающие записи аренд для шардов 0..shard_count-1."""
+        insert_query = get_upsert_insert(self.db_session,
+                                         RefreshLeaseORM.__table__)
+        async with transaction(self.db_session):
+            await self.db_session.execute(
+                insert_query.on_conflict_do_nothing(index_elements=["shard"]),
+                [{"shard": shard, "owner": None, "expires_at": utc_now()}
+                 for shard in range(shard_count)]
+            )
+
+    async def acquire(self, owner: str, shard_count: int,
+                      lease_ttl: float) -> set[int]:
+        """
+        Продлевает аренды владельца owner, отдает лишние сверх равной доли
+        и забирает свободные шарды до равной доли.
+        Возвращает шарды, арендованные owner на lease_ttl секунд.
+        """
+        now = utc_now()
+        expires_at = now + timedelta(seconds=lease_ttl)
+        table = RefreshLeaseORM
+        async with transaction(self.db_session):
+            # Отметка процесса активным до истечения его аренд
+            insert_query = get_upsert_insert(
+                self.db_session, RefreshWorkerORM.__table__)
+            await self.db_session.execute(
+                insert_query.values(worker_id=owner, expires_at=expires_at)
+                .on_conflict_do_update(
+                    index_elements=["worker_id"],
+                    set_={"expires_at": insert_query.excluded.expires_at})
+            )
+            result = await self.db_session.execute(
+                update(table)
+                .where(table.owner == owner, table.shard < shard_count)
+                .values(expires_at=expires_at)
+                .returning(table.shard)
+            )
+            # cast - приведение типов, чтобы не было ошибки от Mypy
+            owned = cast(set[int], set(result.scalars()))
+
+            workers_count = await self.db_session.scalar(
+                select(func.count()).select_from(RefreshWorkerORM)
+                .where(RefreshWorkerORM.expires_at > now)
+                .execution_options(use_primary=True)
+            )
+            fair_share = math.ceil(shard_count / max(workers_count or 0, 1))
+
+            if len(owned) > fair_share:
+                extra = sorted(owned)[fair_share:]
+                await self.db_session.execute(
+                    update(table)
+                    .where(table.shard.in_(extra), table.owner == owner)
+                    .values(owner=None, expires_at=now)
+                )
+                owned.difference_update(extra)
+                logger.info("Released refresh leases %s", extra)
+
+            if len(owned) < fair_share:
+                free_shards = cast(list[int], list(
+                    await self.db_session.scalars(
+                        select(table.shard)
+                        .where(self._is_free(now), table.shard < shard_count)
+                        .execution_options(use_primary=True)
+                    )))
+                # Случайный порядок - процессы реже борются за одни шарды
+                random.shuffle(free_shards)
+                for shard in free_shards:
+                    if len(owned) >= fair_share:
+                        break
+                    # Шард забирается, только если его еще никто не занял
+                    claimed = await self.db_session.execute(
+                        update(table)
+                        .where(table.shard == shard, self._is_free(now))
+                        .values(owner=owner, expires_at=expires_at)
+                    )
+                    if claimed.rowcount == 1:
+                        owned.add(shard)
+        return owned
+
+    async def release(self, owner: str) -> None:
+        """Отдает все аренды владельца (при остановке процесса)."""
+        table = RefreshLeaseORM
+        async with transaction(self.db_session):
+            await self.db_session.execute(
+                update(table).where(table.owner == owner)
+                .values(owner=None, expires_at=utc_now())
+            )
+            await self.db_session.execute(
+                delete(RefreshWorkerORM)
+                .where(RefreshWorkerORM.worker_id == owner)
+            )
+
+    @staticmethod
+    def _is_free(now: datetime):
+        return or_(RefreshLeaseORM.owner.is_(None),
+                   RefreshLeaseORM.expires_at <= now)
@@ -1,5 +1,6 @@
-from sqlalchemy import Column, DateTime, Float, ForeignKey, Integer, String
-from sqlalchemy.orm import relationship
+from sqlalchemy import (Column, DateTime, Float, ForeignKey, Index, Integer,
+                        String)
+from sqlalchemy.orm import Mapped, declared_attr, relationship
 
 from .db import Base
 
@@ -18,6 +19,27 @@ class WeatherORM(Base):
 
     city = relationship("CityORM", back_populates="weather_records")
 
+    __table_args__ = (
+        # Поиск записей города по времени и upsert по (city_id, time)
+        Index("ix_weather_records_city_id_time", "city_id", "time",
+              unique=True),
+    )
+
+
+class CityDataVersionORM(Base):
+    """Версия погодных данных города: увеличивается при каждом изменении
+    погодных записей (для ETag и Last-Modified ответов)."""
+    __tablename__ = "city_data_versions"
+
+    city_id = Column(Integer, ForeignKey("cities.id"), primary_key=True,
+                     autoincrement=False)
+    version = Column(Integer, nullable=False)
+    # Время последнего изменения (UTC)
+    updated_at = Column(DateTime, nullable=False)
+    # Время последнего успешного обновления прогноза (UTC), в том числе
+    # без изменения записей
+    refreshed_at = Column(DateTime, nullable=True)
+
 
 class CityORM(Base):
     __tablename__ = "cities"
@@ -27,3 +49,70 @@ class CityORM(Base):
     latitude = Column(Float, nullable=False)
     longitude = Column(Float, nullable=False)
     weather_records = relationship("WeatherORM", back_populates="city")
+    data_version: Mapped[CityDataVersionORM | None] = relationship(
+        "CityDataVersionORM", uselist=False, lazy="joined")
+
+
+class RefreshLeaseORM(Base):
+    """Аренда шарда городов для фонового обновления погоды:
+    погоду городов шарда обновляет только процесс-владелец аренды."""
+    __tablename__ = "refresh_leases"
+
+    shard = Column(Integer, primary_key=True, autoincrement=False)
+    owner = Column(String, nullable=True)
+    expires_at = Column(DateTime, nullable=False)
+
+
+class RefreshWorkerORM(Base):
+    """Активный процесс фонового обновления погоды (продлевает запись,
+    пока работает) - по ним вычисляется равная доля шардов."""
+    __tablename__ = "refresh_workers"
+
+    worker_id = Column(String, primary_key=True)
+    expires_at = Column(DateTime, nullable=False)
+
+
+class WeatherRollupMixin:
+    """
+    Агрегаты погодных записей города за период (час или день):
+    минимум, максимум и среднее каждого параметра погоды.
+    Столбец city_id объявляется в каждой таблице.
+    """
+
+    id = Column(Integer, primary_key=True)
+    period_start = Column(DateTime, nullable=False)
+    # Количество 15-минутных записей в периоде
+    samples = Column(Integer, nullable=False)
+    temperature_2m_min = Column(Float, nullable=True)
+    temperature_2m_max = Column(Float, nullable=True)
+    temperature_2m_mean = Column(Float, nullable=True)
+    wind_speed_10m_min = Column(Float, nullable=True)
+    wind_speed_10m_max = Column(Float, nullable=True)
+    wind_speed_10m_mean = Column(Float, nullable=True)
+    pressure_msl_min = Column(Float, nullable=True)
+    pressure_msl_max = Column(Float, nullable=True)
+    pressure_msl_mean = Column(Float, nullable=True)
+    rain_min = Column(Float, nullable=True)
+    rain_max = Column(Float, nullable=True)
+    rain_mean = Column(Float, nullable=True)
+    relative_humidity_2m_min = Column(Float, nullable=True)
+    relative_humidity_2m_max = Column(Float, nullable=True)
+    relative_humidity_2m_mean = Column(Float, nullable=True)
+
+    @declared_attr
+    def __table_args__(cls):
+        # Выборка агрегатов города за диапазон и upsert по (city_id, period)
+        return (Index(f"ix_{cls.__tablename__}_city_id_period_start",
+                      "city_id", "period_start", unique=True),)
+
+
+class WeatherHourlyORM(WeatherRollupMixin, Base):
+    __tablename__ = "weather_hourly_rollups"
+
+    city_id = Column(Integer, ForeignKey("cities.id"), nullable=False)
+
+
+class WeatherDailyORM(WeatherRollupMixin, Base):
+    __tablename__ = "weather_daily_rollups"
+
+    city_id = Column(Integer, ForeignKey("cities.id"), nullable=False)
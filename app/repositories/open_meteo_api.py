@@ -1,64 +1,222 @@
-from datetime import datetime, time
+import asyncio
+import math
+import random
+import time
+from array import array
+from bisect import bisect_left
+from datetime import date, datetime, timedelta
 
 import httpx
 
+from app import config
 from app.schemas.coordinates import Coordinates
-from app.schemas.weather import Weather
-from app.utils.exceptions import OpenMeteoAPIError
-from app.utils.log import logger
+from app.schemas.weather import WEATHER_FIELDS
+from app.schemas.weather_series import WeatherSeries
+from app.utils.exceptions import (CircuitOpenError, OpenMeteoAPIError,
+                                  OpenMeteoUnavailableError)
+from app.utils.log import get_logger
+from app.utils.metrics import CallbackMetric, Counter, Histogram
 
-URL = "https://api.open-meteo.com/v1/forecast"
-WEATHER_PARAMS = ",".join(Weather.__annotations__.keys()).replace(",time", "")
+from .circuit_breaker import CircuitBreaker, CircuitState
 
+logger = get_logger(__name__)
 
-def parse_weather(json_data: dict) -> list[Weather]:
+open_meteo_request_duration = Histogram(
+    "open_meteo_request_duration_seconds",
+    "Open-Meteo API request latency")
+open_meteo_errors = Counter(
+    "open_meteo_errors_total",
+    "Failed Open-Meteo API requests", ("reason",))
+open_meteo_retries = Counter(
+    "open_meteo_retries_total", "Retried Open-Meteo API requests")
+
+URL = config.OPEN_METEO_URL
+WEATHER_PARAMS = ",".join(WEATHER_FIELDS)
+
+open_meteo_circuit_breaker = CircuitBreaker(
+    "open-meteo",
+    failure_threshold=config.OPEN_METEO_CIRCUIT_FAILURE_THRESHOLD,
+    recovery_timeout=config.OPEN_METEO_CIRCUIT_RECOVERY_TIMEOUT,
+)
+CIRCUIT_STATE_VALUES = {
+    CircuitState.CLOSED: 0, CircuitState.HALF_OPEN: 1, CircuitState.OPEN: 2}
+CallbackMetric(
+    "open_meteo_circuit_state",
+    "Open-Meteo circuit breaker state (0 closed, 1 half-open, 2 open)",
+    "gauge", lambda: CIRCUIT_STATE_VALUES[open_meteo_circuit_breaker.state])
+
+
+def _find_day_window(times: list[str], day: date) -> tuple[int, int]:
+    """
+    Бинарный поиск границ дня в отсортированной колонке времени.
+    Время в ответе Open-Meteo в формате ISO 8601 ("2025-01-30T12:00"),
+    поэтому строки упорядочены так же, как и моменты времени.
+    """
+    start = bisect_left(times, day.isoformat())
+    end = bisect_left(times, (day + timedelta(days=1)).isoformat(), lo=start)
+    return start, end
+
+
+def get_window_params(day: date | None = None) -> dict:
+    """
+    Параметры запроса прогноза только за указанный день (по умолчанию
+    текущий) - остальные дни parse_weather все равно отбрасывает.
+    """
+    day_string = (day or date.today()).isoformat()
+    return {"start_date": day_string, "end_date": day_string}
+
+
+def parse_weather_columns(
+    json_data: dict, day: date | None = None
+) -> tuple[list[datetime], dict[str, array]]:
+    """
+    Распаковывает полученные от open-meteo данные в колонки за указанный
+    день (по умолчанию текущий): время и по массиву float на каждый параметр.
+    Отсутствующие значения хранятся как NaN.
+    """
+    minutely_15 = json_data.get("minutely_15", {})
+    times: list[str] = minutely_15.get("time") or []
+    start, end = _find_day_window(times, day or date.today())
+
+    time_column = [datetime.fromisoformat(value)
+                   for value in times[start:end]]
+    columns = {}
+    for name in WEATHER_FIELDS:
+        values = (minutely_15.get(name) or [])[start:end]
+        columns[name] = array("d", [math.nan if value is None else value
+                                    for value in values])
+    return time_column, columns
+
+
+def parse_weather(json_data: dict) -> WeatherSeries:
     """
     Распоковывает полученные от open-meteo данные
-    в список объектов WeatherSchema - прогноз погоды на текущий день.
+    во временной ряд WeatherSeries - прогноз погоды на текущий день.
     """
     logger.info("Parsing weather data")
-    weather_forecast = {}
-    param_names = WEATHER_PARAMS.split(",") + ["time"]
-    for param_name in param_names:
-        param_forecast: list = json_data.get("minutely_15", {}).get(param_name)
-        weather_forecast[param_name] = param_forecast
+    time_column, columns = parse_weather_columns(json_data)
+    return WeatherSeries.from_columns(time_column, columns)
+
+
+async def _send_request(client: httpx.AsyncClient,
+                        url_params: dict) -> dict | list[dict]:
+    """Выполняет один запрос к Open-Meteo API."""
+    start_time = time.perf_counter()
+    try:
+        response = await client.get(URL, params=url_params)
+        response.raise_for_status()
+    except httpx.HTTPStatusError as e:
+        status_code = e.response.status_code
+        open_meteo_errors.labels("http_status").inc()
+        logger.error("Open-Meteo API error: %s", status_code)
+        message = f"HTTP error {status_code}: " f"{e.response.text}"
+        if status_code >= 500 or status_code == 429:
+            raise OpenMeteoUnavailableError(message)
+        raise OpenMeteoAPIError(message)
+    except httpx.RequestError as e:
+        open_meteo_errors.labels("connection").inc()
+        logger.error("Open-Meteo connection error: %s", e)
+        raise OpenMeteoUnavailableError(
+            "Connection to weather service failed")
+    finally:
+        open_meteo_request_duration.observe(
+            time.perf_counter() - start_time)
+
+    return response.json()
 
-    start_of_day = datetime.combine(datetime.today(), time.min)
-    end_of_day = datetime.combine(datetime.today(), time.max)
 
-    return [
-        weather
-        for weather in [
-            Weather(**dict(zip(param_names, weather_record)))
-            for weather_record in zip(*weather_forecast.values())
-        ]
-        if start_of_day <= weather.time <= end_of_day
-    ]
+def _get_backoff_delay(attempt: int) -> float:
+    """Экспоненциальная задержка перед повтором с полным случайным
+    разбросом, чтобы повторы разных запросов не совпадали по времени."""
+    backoff = config.OPEN_METEO_BACKOFF_BASE * 2 ** attempt
+    return random.uniform(0, min(config.OPEN_METEO_BACKOFF_MAX, backoff))
+
+
+async def _request_open_meteo(client: httpx.AsyncClient,
+                              url_params: dict) -> dict | list[dict]:
+    """
+    Выполняет запрос к Open-Meteo API и возвращает распакованный JSON.
+    При недоступности API запрос повторяется с экспоненциальной задержкой,
+    а при разомкнутом предохранителе сразу завершается CircuitOpenError.
+    """
+    if not open_meteo_circuit_breaker.allow_request():
+        open_meteo_errors.labels("circuit_open").inc()
+        raise CircuitOpenError()
+
+    try:
+        for attempt in range(config.OPEN_METEO_RETRIES + 1):
+            try:
+                json_data = await _send_request(client, url_params)
+                break
+            except OpenMeteoUnavailableError as e:
+                if attempt == config.OPEN_METEO_RETRIES:
+                    raise
+                delay = _get_backoff_delay(attempt)
+                open_meteo_retries.inc()
+                logger.warning("Retrying Open-Meteo request in %.2f s "
+                               "after error: %s", delay, e)
+                await asyncio.sleep(delay)
+    except OpenMeteoUnavailableError:
+        open_meteo_circuit_breaker.record_failure()
+        raise
+    except OpenMeteoAPIError:
+        # Ошибка запроса (HTTP 4xx) - сервис при этом доступен
+        open_meteo_circuit_breaker.record_success()
+        raise
+    except BaseException:
+        open_meteo_circuit_breaker.release()
+        raise
+    open_meteo_circuit_breaker.record_success()
+    return json_data
 
 
 async def get_weather_records_by_open_meteo_api(
     coordinates: Coordinates,
-) -> list[Weather]:
+    client: httpx.AsyncClient,
+) -> WeatherSeries:
     """Асинхронный запрос к Open-Meteo API"""
     logger.info("Requesting weather by open-meteo API (async)")
     url_params = {
         "latitude": coordinates.latitude,
         "longitude": coordinates.longitude,
         "minutely_15": WEATHER_PARAMS,
+        **get_window_params(),
     }
 
-    try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(URL, params=url_params)
-    except httpx.HTTPStatusError as e:
-        logger.error(f"Open-Meteo API error: {e.response.status_code}")
-        raise OpenMeteoAPIError(
-            f"HTTP error {e.response.status_code}: " f"{e.response.text}"
-        )
-    except httpx.RequestError as e:
-        logger.error(f"Open-Meteo connection error: {str(e)}")
-        raise OpenMeteoAPIError("Connection to weather service failed")
-
-    json_data = response.json()
+    json_data = await _request_open_meteo(client, url_params)
+    if isinstance(json_data, list):
+        json_data = json_data[0]
     weather_records = parse_weather(json_data)
     return weather_records
+
+
+async def get_weather_records_batch_by_open_meteo_api(
+    coordinates_list: list[Coordinates],
+    client: httpx.AsyncClient,
+) -> list[WeatherSeries]:
+    """
+    Асинхронный запрос к Open-Meteo API сразу для нескольких локаций.
+    Возвращает ряды погодных записей в том же порядке, что и координаты.
+    """
+    logger.info("Requesting weather by open-meteo API for %s locations "
+                "(async)", len(coordinates_list))
+    if not coordinates_list:
+        return []
+    url_params = {
+        "latitude": ",".join(str(coordinates.latitude)
+                             for coordinates in coordinates_list),
+        "longitude": ",".join(str(coordinates.longitude)
+                              for coordinates in coordinates_list),
+        "minutely_15": WEATHER_PARAMS,
+        **get_window_params(),
+    }
+
+    json_data = await _request_open_meteo(client, url_params)
+    # Для одной локации Open-Meteo возвращает объект, а не список
+    locations_data = json_data if isinstance(json_data, list) else [json_data]
+    if len(locations_data) != len(coordinates_list):
+        raise OpenMeteoAPIError(
+            f"Expected {len(coordinates_list)} locations in response, "
+            f"got {len(locations_data)}"
+        )
+    return [parse_weather(location_data) for location_data in locations_data]
@@ -0,0 +1,102 @@
+import math
+from typing import Iterable
+
+from app.schemas.coordinates import Coordinates
+
+EARTH_RADIUS_KM = 6371.0088
+# Длина одного градуса широты (км)
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+Cell = tuple[int, int]
+
+
+def haversine_km(first: Coordinates, second: Coordinates) -> float:
+    """Расстояние по поверхности Земли между двумя точками (км)."""
+    lat1, lat2 = math.radians(first.latitude), math.radians(second.latitude)
+    delta_lat = lat2 - lat1
+    delta_lon = math.radians(second.longitude - first.longitude)
+    a = (math.sin(delta_lat / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin(delta_lon / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class CitySpatialIndex:
+    """
+    Пространственный индекс отслеживаемых городов - сетка ячеек
+    размером cell_size x cell_size градусов.
+    Поиск ближайшего города в радиусе просматривает только ячейки,
+    пересекающиеся с этим радиусом.
+    """
+
+    def __init__(self, cell_size: float = 0.5):
+        self.cell_size = cell_size
+        self._cells: dict[Cell, dict[int, Coordinates]] = {}
+        self._city_cells: dict[int, Cell] = {}
+        self._columns = math.ceil(360 / cell_size)
+
+    def __len__(self) -> int:
+        return len(self._city_cells)
+
+    def _get_cell(self, latitude: float, longitude: float) -> Cell:
+        row = math.floor(latitude / self.cell_size)
+        column = math.floor((longitude + 180) / self.cell_size)
+        return row, column % self._columns
+
+    def add(self, city_id: int, coordinates: Coordinates) -> None:
+        self.remove(city_id)
+        cell = self._get_cell(coordinates.latitude, coordinates.longitude)
+        self._cells.setdefault(cell, {})[city_id] = coordinates
+        self._city_cells[city_id] = cell
+
+    def remove(self, city_id: int) -> None:
+        cell = self._city_cells.pop(city_id, None)
+        if cell is None:
+            return
+        cell_cities = self._cells[cell]
+        cell_cities.pop(city_id, None)
+        if not cell_cities:
+            del self._cells[cell]
+
+    def rebuild(self, cities: Iterable[tuple[int, Coordinates]]) -> None:
+        self._cells.clear()
+        self._city_cells.clear()
+        for city_id, coordinates in cities:
+            self.add(city_id, coordinates)
+
+    def nearest(self, coordinates: Coordinates,
+                max_distance_km: float) -> tuple[int, float] | None:
+        """
+        Ближайший город в радиусе max_distance_km.
+        Возвращает (ID города, расстояние в км) или None.
+        """
+        delta_lat = max_distance_km / KM_PER_DEGREE
+        cos_lat = math.cos(math.radians(
+            min(abs(coordinates.latitude) + delta_lat, 90.0)))
+        if cos_lat < 1e-9:
+            delta_lon = 180.0  # Рядом с полюсом подходит любая долгота
+        else:
+            delta_lon = min(delta_lat / cos_lat, 180.0)
+
+        min_row, min_column = self._get_cell(
+            coordinates.latitude - delta_lat,
+            coordinates.longitude - delta_lon)
+        max_row, _ = self._get_cell(
+            coordinates.latitude + delta_lat,
+            coordinates.longitude + delta_lon)
+        columns_count = min(
+            math.floor(2 * delta_lon / self.cell_size) + 2, self._columns)
+
+        nearest: tuple[int, float] | None = None
+        for row in range(min_row, max_row + 1):
+            for offset in range(columns_count):
+                column = (min_column + offset) % self._columns
+                for city_id, city_coordinates in self._cells.get(
+                        (row, column), {}).items():
+                    distance = haversine_km(coordinates, city_coordinates)
+                    if distance <= max_distance_km and (
+                            nearest is None or distance < nearest[1]):
+                        nearest = (city_id, distance)
+        return nearest
+
+
+city_spatial_index = CitySpatialIndex()
@@ -1,16 +1,96 @@
+import asyncio
+from typing import cast
+
+import httpx
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.schemas.coordinates import Coordinates
-from app.schemas.weather import Weather
+from app.schemas.weather_series import WeatherSeries
+from app.utils.exceptions import OpenMeteoAPIError
+from app.utils.log import get_logger
+
+from .forecast_cache import CachedForecast, forecast_cache
+from .open_meteo_api import (get_weather_records_batch_by_open_meteo_api,
+                             get_weather_records_by_open_meteo_api)
 
-from .open_meteo_api import get_weather_records_by_open_meteo_api
+logger = get_logger(__name__)
 
 
 class WeatherRepository:
 
-    def __init__(self, db_session: AsyncSession):
+    def __init__(self, db_session: AsyncSession,
+                 http_client: httpx.AsyncClient):
         self.db_session = db_session
+        self.http_client = http_client
 
     async def get_weather_records_by_coord(self, coordinates: Coordinates
-                                           ) -> list[Weather]:
-        return await get_weather_records_by_open_meteo_api(coordinates)
+                                           ) -> CachedForecast:
+        """
+        Погодные записи по координатам (через кэш прогнозов).
+        Устаревший прогноз из кэша возвращается с пометкой stale.
+        """
+        return await forecast_cache.get_or_fetch(
+            coordinates,
+            lambda: get_weather_records_by_open_meteo_api(coordinates,
+                                                          self.http_client)
+        )
+
+    async def get_weather_records_by_coords(
+            self, coordinates_list: list[Coordinates]
+    ) -> list[WeatherSeries]:
+        """
+        Погодные записи для нескольких локаций одним запросом к API.
+        Полученные прогнозы заодно обновляют кэш прогнозов.
+        """
+        batch_weather_records = (
+            await get_weather_records_batch_by_open_meteo_api(
+                coordinates_list, self.http_client)
+        )
+        for coordinates, weather_records in zip(coordinates_list,
+                                                batch_weather_records):
+            forecast_cache.put(coordinates, weather_records)
+        return batch_weather_records
+
+    async def get_weather_records_in_batches(
+            self, coordinates_list: list[Coordinates], batch_size: int,
+            max_concurrency: int
+    ) -> list[WeatherSeries | OpenMeteoAPIError]:
+        """
+        Погодные записи для многих локаций в том же порядке, что и
+        координаты. Актуальные прогнозы берутся из кэша прогнозов,
+        остальные запрашиваются у API пачками по batch_size локаций,
+        не более max_concurrency запросов одновременно.
+        Ошибка API возвращается вместо погодных записей локаций своей
+        пачки, не прерывая запросы остальных пачек.
+        """
+        results: list[WeatherSeries | OpenMeteoAPIError | None] = [
+            forecast_cache.get(coordinates)
+            for coordinates in coordinates_list]
+        missing = [index for index, weather_records in enumerate(results)
+                   if weather_records is None]
+        batches = [missing[start:start + batch_size]
+                   for start in range(0, len(missing), batch_size)]
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def fetch_batch(batch: list[int]
+                              ) -> list[WeatherSeries] | OpenMeteoAPIError:
+            async with semaphore:
+                try:
+                    return await self.get_weather_records_by_coords(
+                        [coordinates_list[index] for index in batch])
+                except OpenMeteoAPIError as e:
+                    logger.warning("OpenMeteo error for %s locations: %s",
+                                   len(batch), e)
+                    return e
+
+        batches_weather_records = await asyncio.gather(
+            *(fetch_batch(batch) for batch in batches))
+        for batch, batch_weather_records in zip(batches,
+                                                batches_weather_records):
+            for position, index in enumerate(batch):
+                results[index] = (
+                    batch_weather_records
+                    if isinstance(batch_weather_records, OpenMeteoAPIError)
+                    else batch_weather_records[position])
+        # cast - приведение типов, чтобы не было ошибки от Mypy
+        return cast(list[WeatherSeries | OpenMeteoAPIError], results)
@@ -1,14 +1,22 @@
 from http import HTTPStatus
+from typing import AsyncIterator
 
-from fastapi import APIRouter, Depends, HTTPException
+import orjson
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request
+from fastapi.responses import ORJSONResponse, StreamingResponse
 
+from app import config
 from app.depends import get_city_service
-from app.schemas.city import City, CityParams, CityResponse
+from app.schemas.city import (City, CityImportResult, CityParams,
+                              CityResponse)
 from app.services.city_service import CityService
-from app.services.update_weather_services import \
-    create_periodic_weather_update_task
+from app.services.update_weather_services import weather_update_scheduler
 from app.utils.exceptions import SameCityExistsError
-from app.utils.log import logger
+from app.utils.http_cache import (get_cache_headers, is_not_modified,
+                                  make_etag, not_modified_response)
+from app.utils.log import get_logger
+
+logger = get_logger(__name__)
 
 router = APIRouter()
 
@@ -29,12 +37,12 @@ async def add_city_endpoint(
     Метод принимает название города и его координаты и
     добавляет в список городов для которых отслеживается прогноз погоды
     """
-    logger.info(f"Received a request to add a city '{city.name}'")
+    logger.info("Received a request to add a city '%s'", city.name)
     try:
         # Добавляем новый город в БД
         new_city = await city_service.add_city(city)
-        # Создаем задачу обновления погоды для нового города
-        create_periodic_weather_update_task(city=new_city)
+        # Планируем обновление погоды для нового города
+        weather_update_scheduler.schedule(new_city)
     except SameCityExistsError as e:
         raise HTTPException(status_code=409, detail=str(e))
 
@@ -43,19 +51,92 @@ async def add_city_endpoint(
             "name": new_city.name}
 
 
+@router.post(
+    "/cities/bulk",
+    response_model=list[CityImportResult],
+    response_model_exclude_none=True,
+    responses={
+        200: {"description": "Результаты добавления для каждого города"},
+        409: {"description": "Города добавлены параллельным запросом"}
+    }
+)
+async def add_cities_endpoint(
+        cities: list[CityParams] = Body(
+            max_length=config.CITY_BULK_MAX_SIZE),
+        city_service: CityService = Depends(get_city_service)):
+    """
+    Метод принимает список городов (название и координаты) и добавляет
+    в список отслеживаемых те, чьи название и координаты еще не заняты.
+    Возвращает результат для каждого города в порядке запроса.
+    """
+    logger.info("Received a request to add %s cities", len(cities))
+    try:
+        new_cities, results = await city_service.add_cities(cities)
+    except SameCityExistsError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    # Планируем обновление погоды для всех новых городов
+    for new_city in new_cities:
+        weather_update_scheduler.schedule(new_city)
+    return ORJSONResponse([result.model_dump(mode="json", exclude_none=True)
+                           for result in results])
+
+
 @router.get(
     "/cities",
     response_model=list[CityResponse | str],
     response_model_exclude_unset=True,
     responses={
         200: {"description": "Список городов получен"},
+        304: {"description": "Список городов не изменился "
+                             "(If-None-Match)"},
     }
 )
-async def get_cities_endpoint(include_weather: bool | None = None,
-                              city_service: CityService = Depends(
-                                  get_city_service)
-                              ):
-    """Метод возвращает список городов. Есть опция вывести вместе с погодой"""
+async def get_cities_endpoint(
+    request: Request,
+    include_weather: bool | None = None,
+    after_id: int | None = Query(
+        None, ge=0, description="Вернуть города с ID больше указанного"),
+    limit: int | None = Query(
+        None, ge=1, description="Максимальное количество городов"),
+    stream: bool = Query(
+        False, description="Потоковый ответ в формате NDJSON"),
+    city_service: CityService = Depends(get_city_service)
+):
+    """
+    Метод возвращает список городов. Есть опция вывести вместе с погодой.
+    Поддерживает постраничный вывод (after_id, limit) и потоковый ответ
+    в формате NDJSON - по одному городу на строку.
+    Ответ содержит ETag версии страницы списка; если города и их погода
+    не изменились, на условный запрос возвращается 304.
+    """
     logger.info("Received a request to get the list of cities")
-    cities: list[City | str] = await city_service.get_cities(include_weather)
-    return CityResponse.build_response(cities, include_weather)
+    # Версия проверяется до загрузки городов и сериализации ответа
+    data_version = await city_service.get_cities_data_version(after_id,
+                                                              limit)
+    etag = make_etag(data_version, request)
+    headers = get_cache_headers(etag, data_version)
+    if is_not_modified(request, etag, data_version.updated_at):
+        return not_modified_response(headers)
+    if stream:
+        return StreamingResponse(
+            _stream_cities_ndjson(include_weather, after_id, limit),
+            media_type="application/x-ndjson", headers=headers
+        )
+    cities: list[City | str] = await city_service.get_cities(
+        include_weather, after_id, limit)
+    # Сериализация напрямую в JSON, минуя валидацию через response_model
+    return ORJSONResponse(
+        CityResponse.project_cities(cities, include_weather),
+        headers=headers)
+
+
+async def _stream_cities_ndjson(include_weather: bool | None,
+                                after_id: int | None,
+                                limit: int | None) -> AsyncIterator[bytes]:
+    """Сериализует города по одному по мере чтения из БД."""
+    async for city in CityService.stream_cities(include_weather,
+                                                after_id, limit):
+        if isinstance(city, City):
+            yield orjson.dumps(CityResponse.project(city)) + b"\n"
+        else:
+            yield orjson.dumps(city) + b"\n"
@@ -0,0 +1,71 @@
+import time
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.utils.metrics import Counter, Histogram, metrics_registry
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route", ("method", "route"))
+http_requests = Counter(
+    "http_requests_total",
+    "HTTP requests by route and status code", ("method", "route", "status"))
+
+router = APIRouter()
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware, измеряющая время обработки запросов.
+    Метка route - шаблон пути маршрута (например, /api/weather/{city_name}),
+    чтобы число рядов метрики не зависело от параметров пути.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive,
+                       send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        start_time = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Маршрут попадает в scope после сопоставления пути
+            route = scope.get("route")
+            route_path = getattr(route, "path", "unmatched")
+            http_request_duration.labels(
+                scope["method"], route_path
+            ).observe(time.perf_counter() - start_time)
+            http_requests.labels(
+                scope["method"], route_path, str(status_code)).inc()
+
+
+@router.get(
+    "/metrics",
+    response_class=PlainTextResponse,
+    responses={
+        200: {"description": "Метрики приложения в формате Prometheus"},
+    },
+)
+async def get_metrics_endpoint():
+    """Метод возвращает метрики приложения в текстовом формате Prometheus:
+    задержки маршрутов, запросов к БД и к Open-Meteo, фонового обновления
+    погоды и счетчики кэша прогнозов."""
+    return PlainTextResponse(
+        metrics_registry.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
@@ -1,17 +1,47 @@
+import asyncio
 from datetime import datetime
+from typing import AsyncIterator
 
-from fastapi import APIRouter, Depends, HTTPException
+import orjson
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request
+from fastapi.responses import ORJSONResponse, StreamingResponse
 
+from app import config
 from app.depends import get_weather_service
+from app.repositories.forecast_cache import forecast_cache
 from app.schemas.coordinates import Coordinates
-from app.schemas.weather import WeatherQueryParams, WeatherResponse
+from app.schemas.weather import (WeatherBatchItem, WeatherBatchResponse,
+                                 WeatherQueryParams, WeatherResponse,
+                                 WeatherResult)
+from app.schemas.weather_history import Resolution, WeatherRollupResponse
+from app.services.weather_pubsub import weather_pubsub
 from app.services.weather_service import WeatherService
 from app.utils.exceptions import (CityNotFoundError, OpenMeteoAPIError,
                                   TimeRangeError)
-from app.utils.log import logger
+from app.utils.http_cache import (get_cache_headers, is_not_modified,
+                                  make_etag, not_modified_response)
+from app.utils.log import get_logger
+
+logger = get_logger(__name__)
 
 router = APIRouter()
 
+# Пометка ответа с устаревшими данными (RFC 7234, раздел 5.5.1)
+STALE_WARNING = '110 - "Response is Stale"'
+
+
+def _build_weather_response(weather_result: WeatherResult,
+                            fields: tuple[str, ...]) -> ORJSONResponse:
+    """
+    Сериализация напрямую в JSON, минуя валидацию через response_model.
+    Устаревшие данные помечаются заголовком Warning.
+    """
+    response = ORJSONResponse(
+        WeatherResponse.project(weather_result.weather, fields))
+    if weather_result.stale:
+        response.headers["Warning"] = STALE_WARNING
+    return response
+
 
 @router.get(
     "/weather",
@@ -32,12 +62,114 @@ async def get_weather_endpoint(
     Метод принимает координаты и возвращает погоду в текущее время.
     Возвращаемые параметры погоды определюятся через qurey-параметры.
     """
-    logger.info(f"Requesting weather for coordinates {coordinates}")
+    logger.info("Requesting weather for coordinates %s", coordinates)
+    fields = weather_query_params.get_fields()
     try:
-        weather = await weather_service.get_weather_now(coordinates)
+        weather_result = await weather_service.get_weather_now(coordinates,
+                                                               fields)
     except OpenMeteoAPIError as e:
         raise HTTPException(status_code=503, detail=str(e))
-    return WeatherResponse.build_response(weather, weather_query_params)
+    return _build_weather_response(weather_result, fields)
+
+
+@router.post(
+    "/weather/batch",
+    response_model=list[WeatherBatchResponse],
+    response_model_exclude_unset=True,
+    responses={
+        200: {"description": "Погода или причина ошибки для каждого "
+                             "элемента запроса"},
+    },
+)
+async def get_weather_batch_endpoint(
+    items: list[WeatherBatchItem] = Body(
+        max_length=config.WEATHER_BATCH_MAX_SIZE),
+    weather_query_params: WeatherQueryParams = Depends(),
+    weather_service: WeatherService = Depends(get_weather_service),
+):
+    """
+    Метод принимает список городов (по названию) или координат и времени
+    и возвращает погоду для каждого элемента в порядке запроса.
+    Для элемента, погоду которого получить не удалось, возвращается
+    причина ошибки (detail), устаревшие данные помечаются полем stale.
+    Возвращаемые параметры погоды определяются через query-параметры.
+    """
+    logger.info("Requesting weather for %s locations", len(items))
+    fields = weather_query_params.get_fields()
+    weather_results = await weather_service.get_weather_batch(items)
+    return ORJSONResponse([
+        WeatherBatchResponse.project_result(weather_result, fields)
+        for weather_result in weather_results])
+
+
+@router.get(
+    "/weather_updates",
+    response_class=StreamingResponse,
+    responses={
+        200: {"description": "Поток изменений погоды (text/event-stream)"},
+        404: {"description": "Город не найден"},
+    },
+)
+async def subscribe_weather_updates_endpoint(
+    city_names: list[str] = Query(
+        alias="city", min_length=1, max_length=config.WEATHER_PUSH_MAX_CITIES,
+        description="Названия городов (параметр повторяется)"),
+    weather_query_params: WeatherQueryParams = Depends(),
+    weather_service: WeatherService = Depends(get_weather_service),
+):
+    """
+    Метод принимает названия городов и возвращает поток Server-Sent Events:
+    событие weather с добавленными и измененными фоновым обновлением
+    записями о погоде города. Если клиент не успевает читать события,
+    поток завершается событием dropped - после переподключения актуальные
+    данные нужно запросить заново.
+    Возвращаемые параметры погоды определяются через query-параметры.
+    """
+    logger.info("Subscribing to weather updates for cities %s", city_names)
+    try:
+        city_names_by_id = await weather_service.get_city_names_by_id(
+            city_names)
+    except CityNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return StreamingResponse(
+        _stream_weather_updates(city_names_by_id,
+                                weather_query_params.get_fields()),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+async def _stream_weather_updates(city_names_by_id: dict[int, str],
+                                  fields: tuple[str, ...]
+                                  ) -> AsyncIterator[bytes]:
+    """
+    Сериализует изменения погоды в события SSE по мере поступления.
+    Подписка создается при запуске генератора: если клиент отключился
+    до начала ответа, генератор не запускается и подписка не остается
+    в рассылке.
+    """
+    subscription = weather_pubsub.subscribe(city_names_by_id)
+    try:
+        while True:
+            try:
+                update = await asyncio.wait_for(
+                    subscription.get(), config.WEATHER_PUSH_HEARTBEAT)
+            except TimeoutError:
+                yield b": keep-alive\n\n"
+                continue
+            if update is None:
+                yield b"event: dropped\ndata: {}\n\n"
+                return
+            data = orjson.dumps({
+                "city_id": update.city_id,
+                "city_name": city_names_by_id[update.city_id],
+                "version": update.version,
+                "weather_records": update.weather_records.project(fields),
+            })
+            yield (f"event: weather\nid: {update.city_id}-{update.version}"
+                   f"\ndata: ").encode() + data + b"\n\n"
+    finally:
+        weather_pubsub.unsubscribe(subscription)
 
 
 @router.get(
@@ -46,12 +178,14 @@ async def get_weather_endpoint(
     response_model_exclude_unset=True,
     responses={
         200: {"description": "Успешное получение данных о погоде для города"},
+        304: {"description": "Погода не изменилась (If-None-Match)"},
         404: {"description": "Город не найден"},
         503: {"description": "Сервис погоды недоступен"},
         400: {"description": "Неверный диапазон времени"},
     },
 )
 async def get_weather_in_city_endpoint(
+    request: Request,
     city_name: str,
     time: datetime,
     weather_query_params: WeatherQueryParams = Depends(),
@@ -61,11 +195,22 @@ async def get_weather_in_city_endpoint(
     Метод принимает название города и время,
     возвращает для него погоду на текущий день в указанное время.
     Возвращаемые параметры погоды определюятся через qurey-параметры.
+    Ответ с погодой из БД содержит ETag и Last-Modified версии погодных
+    данных города; если данные не изменились, на условный запрос
+    возвращается 304.
     """
-    logger.info(f"Requesting weather for city '{city_name}' at time {time}")
+    logger.info("Requesting weather for city '%s' at time %s", city_name, time)
+    fields = weather_query_params.get_fields()
     try:
-        weather = await weather_service.get_weather_in_city_at_time(
-            city_name, time)
+        # Версия проверяется до поиска записи и сериализации ответа
+        data_version = await weather_service.get_city_data_version(
+            city_name)
+        etag = make_etag(data_version, request)
+        headers = get_cache_headers(etag, data_version)
+        if is_not_modified(request, etag, data_version.updated_at):
+            return not_modified_response(headers)
+        weather_result = await weather_service.get_weather_in_city_at_time(
+            city_name, time, fields)
     except CityNotFoundError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except OpenMeteoAPIError as e:
@@ -73,4 +218,64 @@ async def get_weather_in_city_endpoint(
     except TimeRangeError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-    return WeatherResponse.build_response(weather, weather_query_params)
+    response = _build_weather_response(weather_result, fields)
+    if not weather_result.from_db:
+        # Записей города в БД нет, ответ получен от Open-Meteo - версия
+        # погодных данных города его не описывает
+        headers = {"Cache-Control": "no-cache"}
+    elif weather_result.stale:
+        # Обновление уже запрошено - хранить ответ до него нельзя
+        headers["Cache-Control"] = "no-cache"
+    response.headers.update(headers)
+    return response
+
+
+@router.get(
+    "/weather/{city_name}/history",
+    response_model=list[WeatherRollupResponse],
+    response_model_exclude_unset=True,
+    responses={
+        200: {"description": "Успешное получение истории погоды для города"},
+        404: {"description": "Город не найден"},
+        400: {"description": "Неверный диапазон времени"},
+    },
+)
+async def get_weather_history_endpoint(
+    city_name: str,
+    start: datetime,
+    end: datetime,
+    resolution: Resolution = Resolution.HOUR,
+    weather_query_params: WeatherQueryParams = Depends(),
+    weather_service: WeatherService = Depends(get_weather_service),
+):
+    """
+    Метод принимает название города и диапазон времени,
+    возвращает почасовые или суточные минимум, максимум и среднее
+    параметров погоды за периоды, начавшиеся в этом диапазоне.
+    Возвращаемые параметры погоды определяются через query-параметры.
+    """
+    logger.info("Requesting weather history (resolution=%s) for city '%s' "
+                "from %s to %s", resolution.value, city_name, start, end)
+    fields = weather_query_params.get_fields()
+    try:
+        rollups = await weather_service.get_weather_history(
+            city_name, start, end, resolution, fields)
+    except CityNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except TimeRangeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return ORJSONResponse([WeatherRollupResponse.project(rollup, fields)
+                           for rollup in rollups])
+
+
+@router.get(
+    "/forecast_cache/stats",
+    response_model=dict,
+    responses={
+        200: {"description": "Статистика кэша прогнозов Open-Meteo"},
+    },
+)
+async def get_forecast_cache_stats_endpoint():
+    """Метод возвращает размер кэша прогнозов и счетчики
+    попаданий, промахов и объединенных запросов."""
+    return forecast_cache.stats()
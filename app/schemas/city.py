@@ -1,19 +1,43 @@
-from pydantic import BaseModel
+from datetime import datetime
+from enum import Enum
+from typing import Any, NamedTuple
+
+from pydantic import BaseModel, field_validator
 
 from app.utils.exceptions import WeatherInCityNotFoundError
-from app.utils.log import logger
+from app.utils.log import get_logger
 
 from .coordinates import Coordinates
-from .weather import Weather, WeatherResponse
+from .weather import WeatherResponse
+from .weather_series import WeatherSeries
+
+logger = get_logger(__name__)
 
 
 class City(BaseModel):
     id: int = 0
     name: str
     coordinates: Coordinates
-    weather_records: list[Weather]
+    weather_records: WeatherSeries
+    # Версия и время (UTC) последнего изменения погодных записей
+    version: int = 0
+    updated_at: datetime | None = None
+    # Время (UTC) последнего обновления прогноза, даже без изменений
+    refreshed_at: datetime | None = None
+
+    model_config = {
+        "arbitrary_types_allowed": True
+    }
 
-    def get_weather_records(self) -> list[Weather]:
+    @field_validator("weather_records", mode="before")
+    @classmethod
+    def _convert_weather_records(cls, value: Any) -> WeatherSeries:
+        """Список погодных записей хранится в виде WeatherSeries"""
+        if isinstance(value, WeatherSeries):
+            return value
+        return WeatherSeries.from_records(value or [])
+
+    def get_weather_records(self) -> WeatherSeries:
         if not self.weather_records:
             raise WeatherInCityNotFoundError(
                 f"City {self.name} doesn't have any weather records"
@@ -21,11 +45,45 @@ class City(BaseModel):
         return self.weather_records
 
 
+class DataVersion(NamedTuple):
+    """Версия данных ответа (для ETag), время их изменения (UTC)
+    и через сколько секунд они могут измениться (None - неизвестно)."""
+    tag: str
+    updated_at: datetime | None = None
+    max_age: float | None = None
+
+
+class CityWeatherUpdate(NamedTuple):
+    """Записи о погоде города, добавленные или измененные обновлением,
+    и версия погодных данных после него."""
+    city_id: int
+    version: int
+    weather_records: WeatherSeries
+
+
 class CityParams(BaseModel):
     name: str
     coordinates: Coordinates
 
 
+class CityImportStatus(str, Enum):
+    CREATED = "created"
+    NAME_EXISTS = "name_exists"
+    COORDINATES_EXISTS = "coordinates_exists"
+    # Город с таким же именем или координатами выше в том же запросе
+    DUPLICATE = "duplicate"
+    WEATHER_UNAVAILABLE = "weather_unavailable"
+
+
+class CityImportResult(BaseModel):
+    """Результат добавления одного города при массовом добавлении."""
+    index: int
+    name: str
+    status: CityImportStatus
+    id: int | None = None
+    detail: str | None = None
+
+
 class CityResponse(BaseModel):
     id: int | None = None
     name: str
@@ -49,6 +107,31 @@ class CityResponse(BaseModel):
         return [city_name for city_name in cities
                 if isinstance(city_name, str)]
 
+    @classmethod
+    def project_cities(cls, cities: list[City | str],
+                       include_weather: bool | None = False
+                       ) -> list[dict[str, Any] | str]:
+        """Быстрый путь build_response: список, готовый к сериализации"""
+        if include_weather:
+            return [cls.project(city) for city in cities
+                    if isinstance(city, City)]
+        return [city_name for city_name in cities
+                if isinstance(city_name, str)]
+
+    @staticmethod
+    def project(city: City) -> dict[str, Any]:
+        """
+        Быстрый путь формирования ответа: словарь города с погодными
+        записями прямо из колонок WeatherSeries, без промежуточных моделей.
+        """
+        return {
+            "id": city.id,
+            "name": city.name,
+            "coordinates": {"latitude": city.coordinates.latitude,
+                            "longitude": city.coordinates.longitude},
+            "weather_records": city.weather_records.project(),
+        }
+
     @staticmethod
     def convert_city_to_response(city: City) -> "CityResponse":
         """Конвертация City в CityResponse с вложенными Weather"""
@@ -1,8 +1,15 @@
 from datetime import datetime
+from functools import lru_cache
+from typing import Any, NamedTuple, Protocol
 
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator, model_validator
 
-from app.utils.log import logger
+from app.utils.dates import to_naive_utc
+from app.utils.log import get_logger
+
+from .coordinates import Coordinates
+
+logger = get_logger(__name__)
 
 
 class Weather(BaseModel):
@@ -19,6 +26,29 @@ class Weather(BaseModel):
     }
 
 
+class WeatherRecord(Protocol):
+    """
+    Запись о погоде с временем и атрибутами параметров погоды: Weather
+    или строка результата запроса только с запрошенными параметрами.
+    """
+
+    @property
+    def time(self) -> datetime: ...
+
+
+class WeatherResult(NamedTuple):
+    """Погода, признак того, что данные устарели и обновляются, и того,
+    что запись взята из БД (а не получена от Open-Meteo)."""
+    weather: WeatherRecord
+    stale: bool = False
+    from_db: bool = False
+
+
+# Параметры погоды (без времени) в порядке объявления в Weather
+WEATHER_FIELDS: tuple[str, ...] = tuple(
+    name for name in Weather.model_fields if name != "time")
+
+
 class WeatherQueryParams(BaseModel):
     temperature_2m: bool = True
     wind_speed_10m: bool = True
@@ -26,6 +56,17 @@ class WeatherQueryParams(BaseModel):
     rain: bool = False
     pressure_msl: bool = True
 
+    def get_fields(self) -> tuple[str, ...]:
+        """Запрошенные параметры погоды (проекция вычисляется один раз
+        для каждой комбинации флагов)."""
+        return _get_fields_projection(tuple(self.__dict__.items()))
+
+
+@lru_cache(maxsize=None)
+def _get_fields_projection(
+        flags: tuple[tuple[str, bool], ...]) -> tuple[str, ...]:
+    return tuple(name for name, include in flags if include)
+
 
 class WeatherResponse(BaseModel):
     temperature_2m: float | None = None
@@ -71,3 +112,59 @@ class WeatherResponse(BaseModel):
         }
         weather_response_dict["time"] = weather.time.isoformat()
         return WeatherResponse(**weather_response_dict)
+
+    @staticmethod
+    def project(weather: WeatherRecord,
+                fields: tuple[str, ...] = WEATHER_FIELDS) -> dict[str, Any]:
+        """
+        Быстрый путь формирования ответа: словарь только с полями fields
+        и временем, готовый к сериализации в JSON без валидации.
+        """
+        weather_response_dict: dict[str, Any] = {
+            name: getattr(weather, name) for name in fields
+        }
+        weather_response_dict["time"] = weather.time
+        return weather_response_dict
+
+
+class WeatherBatchItem(BaseModel):
+    """Элемент пакетного запроса погоды: город по названию или координаты
+    и время (по умолчанию - текущее)."""
+    city_name: str | None = None
+    coordinates: Coordinates | None = None
+    time: datetime | None = None
+
+    model_config = {
+        "json_schema_extra": {
+            "example": {"city_name": "Moscow", "time": "2025-01-30T12:00:00"}
+        }
+    }
+
+    @field_validator("time")
+    @classmethod
+    def _to_naive_utc(cls, value: datetime | None) -> datetime | None:
+        return None if value is None else to_naive_utc(value)
+
+    @model_validator(mode="after")
+    def _check_location(self) -> "WeatherBatchItem":
+        if (self.city_name is None) == (self.coordinates is None):
+            raise ValueError("Either city_name or coordinates should be set")
+        return self
+
+
+class WeatherBatchResponse(WeatherResponse):
+    """Погода для элемента пакетного запроса или причина ошибки."""
+    stale: bool | None = None
+    detail: str | None = None
+
+    @staticmethod
+    def project_result(result: "WeatherResult | Exception",
+                       fields: tuple[str, ...] = WEATHER_FIELDS
+                       ) -> dict[str, Any]:
+        """Быстрый путь формирования элемента ответа (как project)."""
+        if isinstance(result, Exception):
+            return {"detail": str(result)}
+        response_dict = WeatherResponse.project(result.weather, fields)
+        if result.stale:
+            response_dict["stale"] = True
+        return response_dict
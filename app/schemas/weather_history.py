@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+from enum import Enum
+from typing import Any, Mapping
+
+from pydantic import BaseModel
+
+from app.schemas.weather import WEATHER_FIELDS
+
+
+class Resolution(str, Enum):
+    HOUR = "hour"
+    DAY = "day"
+
+
+# Агрегаты каждого параметра погоды в порядке столбцов таблиц агрегатов
+AGGREGATES: tuple[str, ...] = ("min", "max", "mean")
+
+# Максимальная длина запрашиваемого диапазона истории
+MAX_HISTORY_RANGES: dict[Resolution, timedelta] = {
+    Resolution.HOUR: timedelta(days=31),
+    Resolution.DAY: timedelta(days=3660),
+}
+
+
+class WeatherAggregate(BaseModel):
+    min: float | None = None
+    max: float | None = None
+    mean: float | None = None
+
+
+class WeatherRollupResponse(BaseModel):
+    period_start: datetime
+    samples: int
+    temperature_2m: WeatherAggregate | None = None
+    wind_speed_10m: WeatherAggregate | None = None
+    pressure_msl: WeatherAggregate | None = None
+    relative_humidity_2m: WeatherAggregate | None = None
+    rain: WeatherAggregate | None = None
+
+    model_config = {
+        "json_schema_extra": {
+            "example": {
+                "period_start": "2025-01-30T12:00:00",
+                "samples": 4,
+                "temperature_2m": {"min": 14.8, "max": 15.6, "mean": 15.2},
+                "wind_speed_10m": {"min": 5.1, "max": 6.0, "mean": 5.6},
+                "pressure_msl": {"min": 1012.8, "max": 1013.2,
+                                 "mean": 1013.0},
+            }
+        }
+    }
+
+    @staticmethod
+    def project(rollup: Mapping[str, Any],
+                fields: tuple[str, ...] = WEATHER_FIELDS) -> dict[str, Any]:
+        """Словарь агрегатов параметров fields, готовый к сериализации
+        в JSON без валидации (как WeatherResponse.project)."""
+        response_dict: dict[str, Any] = {
+            "period_start": rollup["period_start"],
+            "samples": rollup["samples"],
+        }
+        for name in fields:
+            response_dict[name] = {
+                aggregate: rollup[f"{name}_{aggregate}"]
+                for aggregate in AGGREGATES
+            }
+        return response_dict
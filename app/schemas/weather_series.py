@@ -0,0 +1,144 @@
+import hashlib
+import math
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from typing import Any, Iterable, Iterator, Mapping
+
+from .weather import WEATHER_FIELDS, Weather
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def to_timestamp(value: datetime) -> float:
+    """Время (без часового пояса) в секундах от EPOCH."""
+    return (value - EPOCH).total_seconds()
+
+
+def from_timestamp(value: float) -> datetime:
+    return EPOCH + timedelta(seconds=value)
+
+
+class WeatherSeries:
+    """
+    Компактный временной ряд погоды города.
+    Хранит отсортированную колонку времени (секунды от EPOCH) и по массиву
+    float на каждый параметр (NaN - отсутствующее значение).
+    Объекты Weather создаются только при обращении к отдельным записям.
+    """
+
+    __slots__ = ("times", "columns")
+
+    def __init__(self, times: Iterable[float] = (),
+                 columns: Mapping[str, Iterable[float]] | None = None):
+        self.times = array("d", times)
+        columns = columns or {}
+        self.columns = {
+            name: array("d", columns.get(name, [math.nan] * len(self.times)))
+            for name in WEATHER_FIELDS
+        }
+
+    @classmethod
+    def from_columns(cls, time_column: Iterable[datetime],
+                     columns: dict[str, array]) -> "WeatherSeries":
+        """Ряд из уже отсортированных по времени колонок."""
+        return cls((to_timestamp(value) for value in time_column), columns)
+
+    @classmethod
+    def from_records(cls, records: Iterable[Any]) -> "WeatherSeries":
+        """
+        Ряд из объектов с атрибутами time и параметрами погоды
+        (Weather, WeatherORM, строки результата запроса).
+        Отсутствующие у объектов параметры заполняются NaN.
+        """
+        records = sorted(records, key=lambda record: record.time)
+        columns = {}
+        for name in WEATHER_FIELDS:
+            values = [getattr(record, name, None) for record in records]
+            columns[name] = [math.nan if value is None else value
+                             for value in values]
+        return cls((to_timestamp(record.time) for record in records), columns)
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def __iter__(self) -> Iterator[Weather]:
+        for index in range(len(self.times)):
+            yield self.record_at(index)
+
+    def __repr__(self) -> str:
+        return f"WeatherSeries(len={len(self)})"
+
+    def content_hash(self) -> bytes:
+        """Хэш времени и значений ряда - для проверки, изменился ли
+        прогноз, без сравнения с записями в БД."""
+        digest = hashlib.blake2b(self.times.tobytes(), digest_size=16)
+        for name in WEATHER_FIELDS:
+            digest.update(self.columns[name].tobytes())
+        return digest.digest()
+
+    def time_at(self, index: int) -> datetime:
+        return from_timestamp(self.times[index])
+
+    def row_at(self, index: int) -> dict[str, Any]:
+        """Запись с индексом index в виде словаря."""
+        row: dict[str, Any] = {
+            name: None if math.isnan(value := column[index]) else value
+            for name, column in self.columns.items()
+        }
+        row["time"] = self.time_at(index)
+        return row
+
+    def record_at(self, index: int) -> Weather:
+        return Weather.model_construct(**self.row_at(index))
+
+    def rows(self) -> Iterator[dict[str, Any]]:
+        for index in range(len(self.times)):
+            yield self.row_at(index)
+
+    def project(self, fields: tuple[str, ...] = WEATHER_FIELDS
+                ) -> list[dict[str, Any]]:
+        """
+        Записи ряда в виде словарей только с полями fields и временем -
+        без создания объектов Weather. Отсутствующие значения остаются NaN
+        (orjson сериализует их как null).
+        """
+        columns = [(name, self.columns[name]) for name in fields]
+        projected = []
+        for index, timestamp in enumerate(self.times):
+            row: dict[str, Any] = {name: column[index]
+                                   for name, column in columns}
+            row["time"] = from_timestamp(timestamp)
+            projected.append(row)
+        return projected
+
+    def to_records(self) -> list[Weather]:
+        return list(self)
+
+    def nearest_index(self, time: datetime) -> int:
+        """Индекс записи, ближайшей к указанному времени (бинарный поиск)."""
+        if not self.times:
+            raise IndexError("WeatherSeries is empty")
+        timestamp = to_timestamp(time)
+        index = bisect_left(self.times, timestamp)
+        if index == 0:
+            return 0
+        if index == len(self.times):
+            return index - 1
+        before, after = self.times[index - 1], self.times[index]
+        return index - 1 if timestamp - before <= after - timestamp else index
+
+    def nearest(self, time: datetime) -> Weather:
+        """Запись, ближайшая к указанному времени."""
+        return self.record_at(self.nearest_index(time))
+
+    def between(self, start: datetime, end: datetime) -> "WeatherSeries":
+        """Записи в диапазоне времени [start, end]."""
+        start_index = bisect_left(self.times, to_timestamp(start))
+        end_index = bisect_right(self.times, to_timestamp(end),
+                                 lo=start_index)
+        return WeatherSeries(
+            self.times[start_index:end_index],
+            {name: column[start_index:end_index]
+             for name, column in self.columns.items()}
+        )
@@ -0,0 +1,69 @@
+import asyncio
+
+from app import config
+from app.repositories.city_repository import CityRepository
+from app.repositories.db import get_db
+from app.utils.log import get_logger
+from app.utils.metrics import CallbackMetric, Counter
+
+logger = get_logger(__name__)
+
+city_cache_loads = Counter(
+    "city_cache_background_loads_total",
+    "Background loads of a city's weather series into the city cache "
+    "by outcome", ("outcome",))
+
+
+class CityCacheLoader:
+    """
+    Фоновая загрузка городов с погодой в кэш городов.
+    Запрос погоды при промахе кэша читает из БД только одну запись
+    и не ждет загрузки всего ряда города: ряд загружается отдельной
+    задачей (не больше одной на город и max_concurrency одновременно)
+    и попадает в кэш для следующих запросов.
+    """
+
+    def __init__(self, max_concurrency: int):
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        # ID города -> задача загрузки
+        self._tasks: dict[int, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    def request(self, city_id: int) -> None:
+        """Запускает загрузку города, если она еще не выполняется."""
+        if city_id in self._tasks:
+            return
+        task = asyncio.create_task(self._load(city_id))
+        self._tasks[city_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(city_id, None))
+
+    async def stop(self) -> None:
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _load(self, city_id: int) -> None:
+        async with self._semaphore:
+            try:
+                async with get_db() as db:
+                    # Город из БД добавляется в кэш, если его не изменили
+                    # во время загрузки
+                    await CityRepository(db).get_cities_by_ids_or_names(
+                        [city_id], [])
+            except Exception as e:
+                city_cache_loads.labels("error").inc()
+                logger.error("Failed to load city %s into cache: %s",
+                             city_id, e)
+                return
+        city_cache_loads.labels("success").inc()
+
+
+city_cache_loader = CityCacheLoader(
+    max_concurrency=config.CITY_CACHE_LOAD_CONCURRENCY)
+
+CallbackMetric("city_cache_background_loads_in_flight",
+               "Cities being loaded into the city cache in background",
+               "gauge", lambda: len(city_cache_loader))
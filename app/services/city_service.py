@@ -1,11 +1,21 @@
-from typing import cast
+from typing import AsyncIterator, cast
 
+from sqlalchemy.exc import IntegrityError
+
+from app import config
 from app.repositories.city_repository import CityRepository
+from app.repositories.db import get_db
 from app.repositories.weather_repository import WeatherRepository
-from app.schemas.city import City, CityParams
+from app.schemas.city import (City, CityImportResult, CityImportStatus,
+                              CityParams, DataVersion)
 from app.utils.exceptions import (CityNotFoundError, CitySameCordsExistsError,
-                                  CitySameNameExistsError)
-from app.utils.log import logger
+                                  CitySameNameExistsError, OpenMeteoAPIError,
+                                  SameCityExistsError)
+from app.utils.log import get_logger
+
+from .update_weather_services import weather_update_scheduler
+
+logger = get_logger(__name__)
 
 
 class CityService:
@@ -17,20 +27,55 @@ class CityService:
         self.weather_repo = weather_repository
 
     async def get_cities(
-        self, include_weather: bool | None = False
+        self, include_weather: bool | None = False,
+        after_id: int | None = None, limit: int | None = None
     ) -> list[City | str]:
         """Получение списка городов из БД + (опционально) связанные данные"""
         if include_weather:
-            return await self.city_repo.get_cities()
+            return cast(list[City | str],
+                        await self.city_repo.get_cities(after_id, limit))
         else:  # cast - приведение типов, чтобы не было ошибки от Mypy
             return cast(list[City | str],
-                        await self.city_repo.get_city_names())
+                        await self.city_repo.get_city_names(after_id, limit))
+
+    async def get_cities_data_version(
+        self, after_id: int | None = None, limit: int | None = None
+    ) -> DataVersion:
+        """
+        Версия страницы списка городов (для условных запросов) без
+        загрузки городов. max_age - время до ближайшего обновления погоды
+        (известно, только если все города обновляет этот процесс).
+        """
+        data_version = await self.city_repo.get_cities_data_version(
+            after_id, limit)
+        return data_version._replace(
+            max_age=weather_update_scheduler.seconds_until_next_refresh())
+
+    @staticmethod
+    async def stream_cities(
+        include_weather: bool | None = False,
+        after_id: int | None = None, limit: int | None = None
+    ) -> AsyncIterator[City | str]:
+        """
+        Потоковое получение списка городов из БД.
+        Открывает собственную сессию БД, т.к. ответ отправляется клиенту
+        уже после закрытия сессии из зависимостей запроса.
+        """
+        async with get_db() as db:
+            city_repo = CityRepository(db)
+            if include_weather:
+                async for city in city_repo.stream_cities(after_id, limit):
+                    yield city
+            else:
+                async for city_name in city_repo.stream_city_names(
+                        after_id, limit):
+                    yield city_name
 
     async def add_city(self, city_params: CityParams) -> City:
         """Добавление города в БД"""
         logger.info(
-            f"Adding new city with name '{city_params.name}' "
-            f"and coordinates {city_params.coordinates}"
+            "Adding new city with name '%s' and coordinates %s",
+            city_params.name, city_params.coordinates
         )
         await self._check_unique_city(city_params)
         saved_city = await self.city_repo.save_city(
@@ -38,21 +83,95 @@ class CityService:
         )
         return saved_city
 
+    async def add_cities(
+        self, cities_params: list[CityParams]
+    ) -> tuple[list[City], list[CityImportResult]]:
+        """
+        Массовое добавление городов в БД.
+        Уникальность имен и координат проверяется одним запросом для всех
+        городов, прогнозы запрашиваются пачками по WEATHER_UPDATE_BATCH_SIZE
+        городов, новые города сохраняются одной транзакцией.
+        Возвращает сохраненные города и результаты для каждого переданного
+        города в том же порядке.
+        """
+        logger.info("Adding %s new cities", len(cities_params))
+        results: dict[int, CityImportResult] = {}
+        existing_names, existing_coordinates = (
+            await self.city_repo.find_existing_cities(
+                [city.name for city in cities_params],
+                [city.coordinates for city in cities_params])
+        )
+        seen_names: set[str] = set()
+        seen_coordinates: set[tuple[float, float]] = set()
+        unique_cities: list[tuple[int, CityParams]] = []
+        for index, city in enumerate(cities_params):
+            coordinates = (city.coordinates.latitude,
+                           city.coordinates.longitude)
+            if city.name in existing_names:
+                status = CityImportStatus.NAME_EXISTS
+            elif coordinates in existing_coordinates:
+                status = CityImportStatus.COORDINATES_EXISTS
+            elif city.name in seen_names or coordinates in seen_coordinates:
+                status = CityImportStatus.DUPLICATE
+            else:
+                seen_names.add(city.name)
+                seen_coordinates.add(coordinates)
+                unique_cities.append((index, city))
+                continue
+            results[index] = CityImportResult(index=index, name=city.name,
+                                              status=status)
+
+        weather_results = (
+            await self.weather_repo.get_weather_records_in_batches(
+                [city.coordinates for _, city in unique_cities],
+                config.WEATHER_UPDATE_BATCH_SIZE,
+                config.WEATHER_UPDATE_MAX_CONCURRENCY)
+        )
+        new_cities: list[tuple[int, City]] = []
+        for (index, city), weather_records in zip(unique_cities,
+                                                  weather_results):
+            if isinstance(weather_records, OpenMeteoAPIError):
+                results[index] = CityImportResult(
+                    index=index, name=city.name,
+                    status=CityImportStatus.WEATHER_UNAVAILABLE,
+                    detail=str(weather_records))
+            else:
+                new_cities.append((index, City(
+                    **city.model_dump(), weather_records=weather_records)))
+
+        try:
+            saved_cities = await self.city_repo.save_cities(
+                [city for _, city in new_cities])
+        except IntegrityError:
+            # Город с таким же именем добавлен параллельным запросом
+            raise SameCityExistsError("Some of the cities were added by a "
+                                      "concurrent request, retry the import")
+        for (index, _), saved_city in zip(new_cities, saved_cities):
+            results[index] = CityImportResult(
+                index=index, name=saved_city.name,
+                status=CityImportStatus.CREATED, id=saved_city.id)
+        logger.info("Added %s of %s cities", len(saved_cities),
+                    len(cities_params))
+        return saved_cities, [results[index]
+                              for index in range(len(cities_params))]
+
     async def _create_city_with_weather(self, city_params: CityParams) -> City:
         """Создание города с погодой"""
         logger.info("Creating city with weather")
-        weather_records = await self.weather_repo.get_weather_records_by_coord(
-            city_params.coordinates
+        weather_records, _ = (
+            await self.weather_repo.get_weather_records_by_coord(
+                city_params.coordinates)
         )
         return City(**city_params.model_dump(),
                     weather_records=weather_records)
 
     async def _check_unique_city(self, city: CityParams) -> None:
         """Проверка на отсутствие города с таким же именем или координатами"""
-        logger.info(f"Checking uniqueness for city: {city.name}")
+        logger.info("Checking uniqueness for city: %s", city.name)
         # Проверка по имени
         try:
-            await self.city_repo.get_city_by_name(city.name)
+            await self.city_repo.get_city_by_name(city.name,
+                                                  with_weather=False)
         except CityNotFoundError:
             pass
         else:
@@ -61,11 +180,12 @@ class CityService:
 
         # Проверка по координатам
         try:
-            await self.city_repo.get_city_by_coord(city.coordinates)
+            await self.city_repo.get_city_by_coord(city.coordinates,
+                                                   with_weather=False)
         except CityNotFoundError:
             pass
         else:
             raise CitySameCordsExistsError(
                 f"City with coordinates '{city.coordinates}' already exists")
 
-        logger.info(f"City '{city.name}' is unique")
+        logger.info("City '%s' is unique", city.name)
@@ -0,0 +1,126 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+from app import config
+from app.repositories.db import get_db
+from app.repositories.history_repository import WeatherHistoryRepository
+from app.schemas.weather_history import Resolution
+from app.utils.log import get_logger
+from app.utils.metrics import Counter, Histogram
+
+from .update_weather_services import (WeatherUpdateScheduler,
+                                      weather_update_scheduler)
+
+logger = get_logger(__name__)
+
+weather_retention_duration = Histogram(
+    "weather_retention_duration_seconds",
+    "Duration of a weather rollup and retention run")
+weather_retention_deleted_rows = Counter(
+    "weather_retention_deleted_rows_total",
+    "Rows deleted by weather retention", ("table",))
+
+
+def _floor_hour(value: datetime) -> datetime:
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def _floor_day(value: datetime) -> datetime:
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class WeatherRetentionJob:
+    """
+    Периодическое сжатие истории погоды.
+    Пересчитывает почасовые и суточные агрегаты за последние lookback
+    (прогноз на прошедшие часы еще уточняется при обновлениях), затем
+    удаляет 15-минутные записи старше raw_retention и почасовые агрегаты
+    старше hourly_retention. Суточные агрегаты хранятся всегда.
+    Обрабатываются только города шардов, арендованных процессом у
+    планировщика обновлений, поэтому процессы не дублируют работу.
+    """
+
+    def __init__(self, scheduler: WeatherUpdateScheduler, interval: float,
+                 raw_retention: timedelta, hourly_retention: timedelta,
+                 lookback: timedelta, delete_batch_size: int):
+        self.scheduler = scheduler
+        self.interval = interval
+        self.raw_retention = raw_retention
+        self.hourly_retention = hourly_retention
+        self.lookback = lookback
+        self.delete_batch_size = delete_batch_size
+        self._task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _run(self) -> None:
+        # Первый запуск агрегирует всю имеющуюся историю, чтобы записи,
+        # сохраненные до включения агрегации, не удалились без агрегатов
+        full = True
+        while True:
+            try:
+                await self.run_once(full=full)
+                full = False
+            except Exception as e:
+                logger.error("Weather retention run failed: %s", e)
+            await asyncio.sleep(self.interval)
+
+    async def run_once(self, full: bool = False) -> None:
+        """
+        Пересчитывает агрегаты и удаляет устаревшие записи.
+        Записи удаляются, только если попали в пересчитанный диапазон
+        этого или предыдущих запусков.
+        """
+        shards = set(self.scheduler.owned_shards)
+        if not shards:
+            return
+        shard_count = self.scheduler.shard_count
+        start_time = time.perf_counter()
+        # Время записей о погоде - по часам процесса, как в WeatherService
+        now = datetime.now()
+        end = _floor_hour(now)
+        start = _floor_day(now - self.lookback)
+        raw_cutoff = min(_floor_hour(now - self.raw_retention), start)
+        async with get_db() as db:
+            history_repo = WeatherHistoryRepository(db)
+            if full:
+                oldest = await history_repo.get_oldest_weather_time(
+                    shard_count, shards)
+                if oldest is not None:
+                    start = min(start, _floor_day(oldest))
+            for resolution in Resolution:
+                await history_repo.rollup(resolution, start, end,
+                                          shard_count, shards)
+            deleted_records = (
+                await history_repo.delete_weather_records_before(
+                    raw_cutoff, self.delete_batch_size, shard_count, shards))
+            deleted_rollups = await history_repo.delete_rollups_before(
+                Resolution.HOUR, _floor_hour(now - self.hourly_retention),
+                self.delete_batch_size, shard_count, shards)
+        weather_retention_deleted_rows.labels("weather_records").inc(
+            deleted_records)
+        weather_retention_deleted_rows.labels("weather_hourly_rollups").inc(
+            deleted_rollups)
+        weather_retention_duration.observe(time.perf_counter() - start_time)
+        logger.info("Weather rolled up from %s to %s, deleted %s records "
+                    "and %s hourly rollups", start, end, deleted_records,
+                    deleted_rollups)
+
+
+weather_retention_job = WeatherRetentionJob(
+    scheduler=weather_update_scheduler,
+    interval=config.WEATHER_ROLLUP_INTERVAL,
+    raw_retention=timedelta(hours=config.WEATHER_RAW_RETENTION_HOURS),
+    hourly_retention=timedelta(days=config.WEATHER_HOURLY_RETENTION_DAYS),
+    lookback=timedelta(hours=config.WEATHER_ROLLUP_LOOKBACK_HOURS),
+    delete_batch_size=config.WEATHER_RETENTION_DELETE_BATCH,
+)
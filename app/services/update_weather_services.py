@@ -1,57 +1,410 @@
 import asyncio
+import heapq
+import random
+import time
+from datetime import datetime
+from typing import Callable
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app import config
 from app.repositories.city_repository import CityRepository
-from app.repositories.db import get_db, transaction
+from app.repositories.db import get_db
+from app.repositories.http_client import get_http_client
+from app.repositories.lease_repository import LeaseRepository
 from app.repositories.weather_repository import WeatherRepository
-from app.schemas.city import City
+from app.schemas.city import City, CityWeatherUpdate
+from app.utils.dates import utc_now
 from app.utils.exceptions import CityNotFoundError, OpenMeteoAPIError
-from app.utils.log import logger
+from app.utils.log import get_logger
+from app.utils.metrics import (LAG_BUCKETS, CallbackMetric, Counter,
+                               Histogram)
 
-tasks: dict[int, asyncio.Task] = {}
+logger = get_logger(__name__)
 
+weather_refresh_duration = Histogram(
+    "weather_refresh_duration_seconds",
+    "Duration of a background weather refresh batch")
+weather_refresh_lag = Histogram(
+    "weather_refresh_lag_seconds",
+    "Delay between the scheduled and the actual refresh of a city",
+    buckets=LAG_BUCKETS)
+weather_refresh_batches = Counter(
+    "weather_refresh_batches_total",
+    "Background weather refresh batches by outcome", ("outcome",))
+weather_refresh_unchanged = Counter(
+    "weather_refresh_unchanged_cities_total",
+    "Cities whose refreshed forecast matched the last one and was not "
+    "written to the DB")
 
-async def weather_update(city: City, db: AsyncSession) -> None:
-    logger.info(f"Weather update started for city {city.id}")
-    weather_repo = WeatherRepository(db)
+
+UpdateListener = Callable[[CityWeatherUpdate], None]
+
+
+async def weather_update_batch(
+        cities: list[City], db: AsyncSession,
+        on_update: UpdateListener | None = None,
+        content_hashes: dict[int, bytes] | None = None) -> list[int]:
+    """
+    Обновление погоды для группы городов одним запросом к Open-Meteo.
+    Записи каждого города сохраняются отдельно; после фиксации транзакции
+    добавленные и измененные записи передаются в on_update.
+    content_hashes - хэши последних сохраненных прогнозов по ID города:
+    записи города, прогноз которого не изменился, не записываются в БД -
+    для всех таких городов одним запросом отмечается только время
+    обновления прогноза.
+    Возвращает ID городов, которые не были найдены в БД.
+    """
+    logger.info("Weather update started for cities %s",
+                [city.id for city in cities])
+    weather_repo = WeatherRepository(db, get_http_client())
     city_repo = CityRepository(db)
 
-    new_weather_records = await weather_repo.get_weather_records_by_coord(
-        city.coordinates
+    batch_weather_records = await weather_repo.get_weather_records_by_coords(
+        [city.coordinates for city in cities]
     )
-    await city_repo.update_weather_records(city.id, new_weather_records)
+    not_found_city_ids = []
+    unchanged_city_ids = []
+    for city, new_weather_records in zip(cities, batch_weather_records):
+        content_hash = new_weather_records.content_hash()
+        if (content_hashes is not None
+                and content_hashes.get(city.id) == content_hash):
+            logger.debug("Weather unchanged for city %s", city.id)
+            weather_refresh_unchanged.inc()
+            unchanged_city_ids.append(city.id)
+            continue
+        try:
+            update = await city_repo.update_weather_records(
+                city.id, new_weather_records)
+            logger.info("Weather updated for city %s", city.id)
+            if content_hashes is not None:
+                content_hashes[city.id] = content_hash
+            if on_update is not None and update.weather_records:
+                on_update(update)
+        except CityNotFoundError:
+            logger.error("City %s not found. Stopping updates.", city.id)
+            not_found_city_ids.append(city.id)
+    await city_repo.mark_weather_refreshed(unchanged_city_ids)
+    return not_found_city_ids
 
 
-async def periodic_weather_update(city: City) -> None:
+class WeatherUpdateScheduler:
     """
-    Фоновое обновление погоды для города каждые 15 минут.
+    Планировщик фонового обновления погоды.
+    Города хранятся в очереди с приоритетом по времени следующего обновления,
+    одна фоновая задача забирает из неё созревшие города пачками.
+    Города разбиты на shard_count шардов (ID города по модулю shard_count);
+    процесс обновляет только города шардов, аренда которых хранится в БД
+    за ним (worker_id), поэтому несколько процессов и узлов делят нагрузку
+    без повторных запросов к Open-Meteo.
     """
-    logger.info(f"Starting periodic weather update for city {city.id}")
-    while True:
-        await asyncio.sleep(15)  # 15 минут (для тестирования 15сек)
 
-        async with get_db() as db, transaction(db):
+    def __init__(self, interval: float, jitter: float, batch_size: int,
+                 batch_window: float, max_concurrency: int,
+                 shard_count: int, lease_ttl: float,
+                 lease_renew_interval: float, worker_id: str):
+        self.interval = interval
+        self.jitter = jitter
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.max_concurrency = max_concurrency
+        self.shard_count = shard_count
+        self.lease_ttl = lease_ttl
+        self.lease_renew_interval = lease_renew_interval
+        self.worker_id = worker_id
+        self._owned_shards: set[int] = set()
+        # Количество городов в БД при последнем чтении городов шардов
+        self._cities_count: int | None = None
+        # Время (loop.time()), до которого аренды гарантированно действуют
+        self._lease_deadline = 0.0
+        self._cities: dict[int, City] = {}
+        # Актуальное время обновления города; записи в очереди с другим
+        # временем считаются устаревшими и пропускаются
+        self._due_times: dict[int, float] = {}
+        self._queue: list[tuple[float, int]] = []
+        self._wakeup = asyncio.Event()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._in_flight: set[asyncio.Task] = set()
+        self._task: asyncio.Task | None = None
+        self._lease_task: asyncio.Task | None = None
+        self._update_listeners: list[UpdateListener] = []
+        # ID города -> хэш последнего сохраненного прогноза
+        self._content_hashes: dict[int, bytes] = {}
+        # ID города -> время (UTC) последнего успешного обновления
+        self._refreshed_at: dict[int, datetime] = {}
+
+    def __len__(self) -> int:
+        return len(self._cities)
+
+    def __contains__(self, city_id: int) -> bool:
+        return city_id in self._cities
+
+    @property
+    def owned_shards(self) -> set[int]:
+        return self._owned_shards
+
+    def shard_of(self, city_id: int) -> int:
+        return city_id % self.shard_count
+
+    def owns(self, city_id: int) -> bool:
+        """Обновляет ли этот процесс погоду города."""
+        return self.shard_of(city_id) in self._owned_shards
+
+    def schedule(self, city: City, delay: float | None = None) -> None:
+        """Планирует обновление погоды для города через delay секунд
+        (по умолчанию через интервал обновления со случайным разбросом).
+        Города чужих шардов обновляют их владельцы."""
+        if not self.owns(city.id):
+            logger.debug("City %s belongs to shard %s of another worker",
+                         city.id, self.shard_of(city.id))
+            return
+        if delay is None:
+            delay = self._next_delay()
+        due_time = asyncio.get_running_loop().time() + delay
+        self._cities[city.id] = city
+        self._due_times[city.id] = due_time
+        heapq.heappush(self._queue, (due_time, city.id))
+        self._wakeup.set()
+
+    def request_refresh(self, city: City) -> None:
+        """Досрочно обновляет погоду города, если обновление еще
+        не выполняется и не запланировано на ближайшее время."""
+        if city.id in self._cities and city.id not in self._due_times:
+            return  # Обновление уже выполняется
+        due_time = self._due_times.get(city.id)
+        loop_time = asyncio.get_running_loop().time()
+        if due_time is not None and due_time <= loop_time + self.batch_window:
+            return
+        self.schedule(city, delay=0)
+
+    def add_update_listener(self, listener: UpdateListener) -> None:
+        """Подписывает listener на изменения погоды, сохраненные
+        фоновым обновлением этого процесса."""
+        self._update_listeners.append(listener)
+
+    def remove_update_listener(self, listener: UpdateListener) -> None:
+        self._update_listeners.remove(listener)
+
+    def _notify(self, update: CityWeatherUpdate) -> None:
+        for listener in self._update_listeners:
+            try:
+                listener(update)
+            except Exception as e:
+                logger.error("Weather update listener failed: %s", e)
+
+    def last_refreshed_at(self, city_id: int) -> datetime | None:
+        """Время (UTC) последнего успешного обновления погоды города этим
+        процессом, в том числе без изменения записей в БД."""
+        return self._refreshed_at.get(city_id)
+
+    def seconds_until_refresh(self, city_id: int) -> float | None:
+        """Через сколько секунд запланировано обновление погоды города;
+        None - город обновляет другой процесс или обновление уже
+        выполняется."""
+        due_time = self._due_times.get(city_id)
+        if due_time is None:
+            return None
+        return max(0.0, due_time - asyncio.get_running_loop().time())
+
+    def seconds_until_next_refresh(self) -> float | None:
+        """Через сколько секунд обновится погода хотя бы одного города;
+        None - если часть шардов обновляют другие процессы."""
+        if len(self._owned_shards) < self.shard_count:
+            return None
+        if not self._queue:
+            return self.interval
+        # В очереди могут быть устаревшие записи - оценка снизу
+        return max(0.0,
+                   self._queue[0][0] - asyncio.get_running_loop().time())
+
+    def unschedule(self, city_id: int) -> None:
+        """Исключает город из фонового обновления."""
+        self._cities.pop(city_id, None)
+        self._due_times.pop(city_id, None)
+        # Пока город обновляет другой процесс, записи в БД могут измениться
+        self._content_hashes.pop(city_id, None)
+        self._refreshed_at.pop(city_id, None)
+
+    async def start(self) -> None:
+        """Арендует шарды, восстанавливает расписание по таблице городов
+        и запускает фоновые задачи."""
+        async with get_db() as db:
+            await LeaseRepository(db).ensure_shards(self.shard_count)
+        await self._sync_leases()
+        self._task = asyncio.create_task(self._run())
+        self._lease_task = asyncio.create_task(self._maintain_leases())
+
+    async def stop(self) -> None:
+        """Останавливает фоновые задачи и текущие обновления,
+        освобождает аренды шардов для других процессов."""
+        tasks = list(self._in_flight)
+        for task in (self._task, self._lease_task):
+            if task is not None:
+                tasks.append(task)
+        self._task = self._lease_task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        try:
+            async with get_db() as db:
+                await LeaseRepository(db).release(self.worker_id)
+        except Exception as e:
+            logger.error("Failed to release refresh leases: %s", e)
+        self._owned_shards = set()
+
+    async def _maintain_leases(self) -> None:
+        while True:
+            await asyncio.sleep(self.lease_renew_interval)
             try:
-                await weather_update(city, db)
-                logger.info(f"Weather updated for city {city.id}")
-            except OpenMeteoAPIError as e:
-                logger.warning(f"OpenMeteo error for city {city.id}: {str(e)}")
-            except CityNotFoundError:
-                logger.error(f"City {city.id} not found. Stopping updates.")
-                break  # Завершаем задачу, если город не найден
+                await self._sync_leases()
             except Exception as e:
-                logger.error(f"Unexpected error for city {city.id}: {str(e)}")
+                logger.error("Failed to renew refresh leases: %s", e)
+
+    async def _sync_leases(self) -> None:
+        """
+        Продлевает и перераспределяет аренды шардов и приводит расписание
+        в соответствие с ними: города потерянных шардов исключаются,
+        города новых шардов и добавленные другими процессами - планируются.
+        Города, добавленные другими процессами, добавляются и
+        в пространственный индекс.
+        Выборка городов шардов (ID по модулю не использует индексы)
+        повторяется, только если изменились арендованные шарды или
+        количество городов в БД.
+        """
+        started_at = asyncio.get_running_loop().time()
+        async with get_db() as db:
+            city_repo = CityRepository(db)
+            owned_shards = await LeaseRepository(db).acquire(
+                self.worker_id, self.shard_count, self.lease_ttl)
+            cities_count = await city_repo.get_cities_count()
+            cities: list[City] | None = None
+            if (owned_shards != self._owned_shards
+                    or cities_count != self._cities_count):
+                cities = await city_repo.get_cities_without_weather(
+                    self.shard_count, owned_shards) if owned_shards else []
+                self._cities_count = cities_count
+            try:
+                await city_repo.refresh_spatial_index(cities_count)
+            except Exception as e:
+                # Ошибка индекса не должна мешать продлению аренд
+                logger.error("Failed to refresh spatial index: %s", e)
+        self._lease_deadline = started_at + self.lease_ttl
+        if owned_shards != self._owned_shards:
+            logger.info("Worker %s owns refresh shards %s",
+                        self.worker_id, sorted(owned_shards))
+        self._owned_shards = owned_shards
+
+        for city_id in [city_id for city_id in self._cities
+                        if not self.owns(city_id)]:
+            self.unschedule(city_id)
+        if cities is None:
+            return
+        new_cities = [city for city in cities if city.id not in self._cities]
+        if new_cities:
+            logger.info("Scheduling weather updates for %s cities",
+                        len(new_cities))
+        for city in new_cities:
+            # Первые обновления равномерно распределяются по интервалу
+            self.schedule(city, delay=random.uniform(0, self.interval))
+
+    def _next_delay(self) -> float:
+        return max(0.0, self.interval
+                   + random.uniform(-self.jitter, self.jitter))
+
+    def _pop_due_cities(self, now: float, until: float) -> list[City]:
+        batch: list[City] = []
+        while (self._queue and self._queue[0][0] <= until
+               and len(batch) < self.batch_size):
+            due_time, city_id = heapq.heappop(self._queue)
+            if self._due_times.get(city_id) != due_time:
+                continue  # Город удален или перепланирован
+            del self._due_times[city_id]
+            weather_refresh_lag.observe(max(0.0, now - due_time))
+            batch.append(self._cities[city_id])
+        return batch
+
+    async def _run(self) -> None:
+        logger.info("Weather update scheduler started")
+        loop = asyncio.get_running_loop()
+        while True:
+            self._wakeup.clear()
+            if not self._queue:
+                await self._wakeup.wait()
+                continue
+
+            delay = self._queue[0][0] - loop.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except TimeoutError:
+                    pass
+                continue
+
+            # Вместе с созревшим городом забираем и те, чье обновление
+            # наступит в пределах окна, чтобы пачки были полнее
+            now = loop.time()
+            batch = self._pop_due_cities(now, now + self.batch_window)
+            if not batch:
+                continue
+            await self._semaphore.acquire()
+            task = asyncio.create_task(self._update_batch(batch))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _update_batch(self, batch: list[City]) -> None:
+        start_time = time.perf_counter()
+        outcome = "success"
+        try:
+            if asyncio.get_running_loop().time() >= self._lease_deadline:
+                # Аренда могла перейти к другому процессу
+                outcome = "lease_expired"
+                logger.warning("Refresh leases expired, skipping cities %s",
+                               [city.id for city in batch])
+                return
+            async with get_db() as db:
+                not_found_city_ids = await weather_update_batch(
+                    batch, db, on_update=self._notify,
+                    content_hashes=self._content_hashes)
+            refreshed_at = utc_now()
+            for city in batch:
+                self._refreshed_at[city.id] = refreshed_at
+            for city_id in not_found_city_ids:
+                self.unschedule(city_id)
+        except OpenMeteoAPIError as e:
+            outcome = "api_error"
+            logger.warning("OpenMeteo error for cities %s: %s",
+                           [city.id for city in batch], e)
+        except Exception as e:
+            outcome = "error"
+            logger.error("Unexpected error for cities %s: %s",
+                         [city.id for city in batch], e)
+        finally:
+            weather_refresh_duration.observe(time.perf_counter() - start_time)
+            weather_refresh_batches.labels(outcome).inc()
+            self._semaphore.release()
+            for city in batch:
+                if city.id in self._cities and city.id not in self._due_times:
+                    self.schedule(city)
 
-    tasks.pop(city.id, None)
-    logger.info(f"Stopped periodic updates for city {city.id}")
 
+weather_update_scheduler = WeatherUpdateScheduler(
+    interval=config.WEATHER_UPDATE_INTERVAL,
+    jitter=config.WEATHER_UPDATE_JITTER,
+    batch_size=config.WEATHER_UPDATE_BATCH_SIZE,
+    batch_window=config.WEATHER_UPDATE_BATCH_WINDOW,
+    max_concurrency=config.WEATHER_UPDATE_MAX_CONCURRENCY,
+    shard_count=config.WEATHER_UPDATE_SHARDS,
+    lease_ttl=config.WEATHER_UPDATE_LEASE_TTL,
+    lease_renew_interval=config.WEATHER_UPDATE_LEASE_RENEW_INTERVAL,
+    worker_id=config.WORKER_ID,
+)
 
-def create_periodic_weather_update_task(city: City) -> None:
-    """Создание задачи для периодического обновления погоды для города."""
-    logger.info(f"Creating periodic weather update task for city ID {city.id}")
-    if city.id in tasks:
-        logger.info(f"Task for city ID {city.id} already exists.")
-        return
-    task = asyncio.create_task(periodic_weather_update(city))
-    tasks[city.id] = task
+CallbackMetric("weather_refresh_scheduled_cities",
+               "Cities scheduled for background weather refresh",
+               "gauge", lambda: len(weather_update_scheduler))
+CallbackMetric("weather_refresh_batches_in_flight",
+               "Background weather refresh batches in progress",
+               "gauge", lambda: len(weather_update_scheduler._in_flight))
+CallbackMetric("weather_refresh_owned_shards",
+               "Refresh shards leased by this worker",
+               "gauge", lambda: len(weather_update_scheduler.owned_shards))
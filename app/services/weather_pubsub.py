@@ -0,0 +1,188 @@
+import asyncio
+from typing import Iterable
+
+from app import config
+from app.repositories.city_cache import city_cache
+from app.repositories.city_repository import CityRepository
+from app.repositories.db import get_db
+from app.schemas.city import CityWeatherUpdate
+from app.utils.log import get_logger
+from app.utils.metrics import CallbackMetric, Counter
+
+from .update_weather_services import (WeatherUpdateScheduler,
+                                      weather_update_scheduler)
+
+logger = get_logger(__name__)
+
+weather_push_updates = Counter(
+    "weather_push_updates_total",
+    "Weather updates published to subscribers by origin "
+    "(local refresh or poll of another worker's refresh)", ("origin",))
+weather_push_dropped = Counter(
+    "weather_push_dropped_subscribers_total",
+    "Subscribers disconnected because their buffer was full")
+
+
+class WeatherSubscription:
+    """
+    Подписка на изменения погоды городов city_ids.
+    Изменения копятся в ограниченном буфере; если подписчик не успевает
+    их забирать и буфер заполнен, подписка отключается, а get
+    возвращает None.
+    """
+
+    def __init__(self, city_ids: frozenset[int], buffer_size: int):
+        self.city_ids = city_ids
+        self.dropped = False
+        self._queue: asyncio.Queue[CityWeatherUpdate | None] = (
+            asyncio.Queue(buffer_size))
+
+    async def get(self) -> CityWeatherUpdate | None:
+        """Следующее изменение; None - подписка отключена."""
+        return await self._queue.get()
+
+    def _put(self, update: CityWeatherUpdate) -> bool:
+        try:
+            self._queue.put_nowait(update)
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    def _close(self) -> None:
+        """Отбрасывает накопленные изменения и завершает get."""
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        self._queue.put_nowait(None)
+
+
+class WeatherPubSub:
+    """
+    Рассылка изменений погоды подписчикам внутри процесса.
+    Изменения городов, которые обновляет этот процесс, приходят от
+    планировщика сразу после фиксации транзакции - только добавленные
+    и измененные записи. Версии погодных данных остальных городов
+    с подписчиками (их обновляют другие процессы) проверяются одним
+    запросом раз в poll_interval секунд; при изменении рассылаются все
+    записи города.
+    Рассылка не ждет подписчиков: медленный подписчик с заполненным
+    буфером отключается и не задерживает остальных.
+    """
+
+    def __init__(self, scheduler: WeatherUpdateScheduler, buffer_size: int,
+                 poll_interval: float):
+        self.scheduler = scheduler
+        self.buffer_size = buffer_size
+        self.poll_interval = poll_interval
+        # ID города -> подписки
+        self._subscriptions: dict[int, set[WeatherSubscription]] = {}
+        # ID города -> последняя разосланная (или известная) версия
+        self._versions: dict[int, int] = {}
+        self._task: asyncio.Task | None = None
+
+    def __len__(self) -> int:
+        return len({subscription
+                    for subscriptions in self._subscriptions.values()
+                    for subscription in subscriptions})
+
+    async def start(self) -> None:
+        self.scheduler.add_update_listener(self.publish)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Останавливает проверку версий и отключает всех подписчиков,
+        чтобы их потоковые ответы завершились."""
+        self.scheduler.remove_update_listener(self.publish)
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for subscriptions in list(self._subscriptions.values()):
+            for subscription in list(subscriptions):
+                self._drop(subscription)
+
+    def subscribe(self, city_ids: Iterable[int]) -> WeatherSubscription:
+        subscription = WeatherSubscription(frozenset(city_ids),
+                                           self.buffer_size)
+        for city_id in subscription.city_ids:
+            self._subscriptions.setdefault(city_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: WeatherSubscription) -> None:
+        for city_id in subscription.city_ids:
+            subscriptions = self._subscriptions.get(city_id)
+            if subscriptions is None:
+                continue
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._subscriptions[city_id]
+                self._versions.pop(city_id, None)
+
+    def publish(self, update: CityWeatherUpdate,
+                origin: str = "local") -> None:
+        """Передает изменение подписчикам города без ожидания."""
+        subscriptions = self._subscriptions.get(update.city_id)
+        if not subscriptions:
+            return
+        self._versions[update.city_id] = max(
+            update.version, self._versions.get(update.city_id, 0))
+        weather_push_updates.labels(origin).inc()
+        for subscription in list(subscriptions):
+            if not subscription._put(update):
+                logger.warning("Weather subscriber is too slow, "
+                               "disconnecting")
+                weather_push_dropped.inc()
+                self._drop(subscription)
+
+    def _drop(self, subscription: WeatherSubscription) -> None:
+        self.unsubscribe(subscription)
+        subscription.dropped = True
+        subscription._close()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.poll_once()
+            except Exception as e:
+                logger.error("Weather version poll failed: %s", e)
+
+    async def poll_once(self) -> None:
+        """Рассылает изменения городов с подписчиками, которые обновили
+        другие процессы."""
+        city_ids = [city_id for city_id in self._subscriptions
+                    if not self.scheduler.owns(city_id)]
+        if not city_ids:
+            return
+        async with get_db() as db:
+            city_repo = CityRepository(db)
+            versions = await city_repo.get_data_versions(city_ids)
+            changed_ids = []
+            for city_id, version in versions.items():
+                known_version = self._versions.get(city_id)
+                if known_version is None:
+                    # Первая проверка после подписки - только запоминаем
+                    self._versions[city_id] = version
+                elif version > known_version:
+                    changed_ids.append(city_id)
+            if not changed_ids:
+                return
+            for city_id in changed_ids:
+                # Город в кэше мог остаться в версии до изменения
+                city_cache.invalidate(city_id)
+            cities = await city_repo.get_cities_by_ids_or_names(
+                changed_ids, [])
+        for city in cities:
+            self.publish(CityWeatherUpdate(city.id, city.version,
+                                           city.weather_records),
+                         origin="poll")
+
+
+weather_pubsub = WeatherPubSub(
+    scheduler=weather_update_scheduler,
+    buffer_size=config.WEATHER_PUSH_BUFFER_SIZE,
+    poll_interval=config.WEATHER_PUSH_POLL_INTERVAL,
+)
+
+CallbackMetric("weather_push_subscribers",
+               "Active weather update subscriptions",
+               "gauge", lambda: len(weather_pubsub))
@@ -1,80 +1,303 @@
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
+from typing import Any, cast
 
+from app import config
 from app.repositories.city_repository import CityRepository
+from app.repositories.history_repository import WeatherHistoryRepository
 from app.repositories.weather_repository import WeatherRepository
 from app.schemas.coordinates import Coordinates
-from app.schemas.weather import Weather
-from app.utils.exceptions import (CityNotFoundError, TimeRangeError,
-                                  WeatherInCityNotFoundError)
-from app.utils.log import logger
+from app.schemas.city import City, DataVersion
+from app.schemas.weather import (WEATHER_FIELDS, Weather, WeatherBatchItem,
+                                 WeatherRecord, WeatherResult)
+from app.schemas.weather_history import MAX_HISTORY_RANGES, Resolution
+from app.schemas.weather_series import WeatherSeries
+from app.utils.exceptions import (CityNotFoundError, OpenMeteoAPIError,
+                                  TimeRangeError, WeatherInCityNotFoundError)
+from app.utils.dates import to_naive_utc, utc_now
+from app.utils.log import get_logger
+from app.utils.metrics import Counter
+
+from .city_cache_loader import city_cache_loader
+from .update_weather_services import weather_update_scheduler
+
+logger = get_logger(__name__)
+
+weather_lookups = Counter(
+    "weather_lookups_total",
+    "Weather lookups by the source that served them "
+    "(db, db_stale, api or cache_stale)",
+    ("method", "source"))
 
 
 class WeatherService:
     def __init__(
         self, weather_repository: WeatherRepository,
-        city_repoitory: CityRepository
+        city_repoitory: CityRepository,
+        history_repository: WeatherHistoryRepository
     ):
         self.weather_repo = weather_repository
         self.city_repo = city_repoitory
+        self.history_repo = history_repository
+        self.freshness_window = timedelta(
+            seconds=config.WEATHER_FRESHNESS_WINDOW)
 
-    async def get_weather_now(self, coordinates: Coordinates) -> Weather:
+    async def get_weather_now(
+        self, coordinates: Coordinates,
+        fields: tuple[str, ...] = WEATHER_FIELDS
+    ) -> WeatherResult:
         """
         Возвращает текущую погоду по координатам.
+        Из БД читаются только параметры погоды fields.
         Запросом к Open-Meteo API отправляется только тогда, если его нет в БД.
+        В БД ищется ближайший отслеживаемый город в пределах
+        CITY_COORDINATES_TOLERANCE_KM от указанных координат; запись
+        ищется как в get_weather_in_city_at_time.
+        Устаревшие данные отдаются с пометкой stale.
         """
-        logger.info(f"Getting current weather for coordinates {coordinates}")
+        logger.info("Getting current weather for coordinates %s", coordinates)
+        now = datetime.now()
         try:  # В начале пытаемся получить погоду из БД
             logger.info("Trying to get weather from DB")
-            city = await self.city_repo.get_city_by_coord(coordinates)
-            weather_records = city.get_weather_records()
-            weather = self._search_closest_to_time_weather_record(
-                weather_records=weather_records, time=datetime.now()
-            )
-            logger.info("Weather found in DB")
+            city = await self.city_repo.get_nearest_city(
+                coordinates, config.CITY_COORDINATES_TOLERANCE_KM,
+                with_weather=False)
+            weather = await self._get_weather_record_at_time(city, now,
+                                                             fields)
         except (CityNotFoundError, WeatherInCityNotFoundError):
             logger.warning("Weather not found in DB. Fetching from API")
-            weather = await self._get_weather_closest_to_time(
-                coordinates, time=datetime.now()
+            return await self._get_weather_closest_to_time(
+                coordinates, time=now, method="now"
             )
-        return weather
+        logger.info("Weather found in DB")
+        return self._check_freshness(city, weather, method="now")
 
     async def get_weather_in_city_at_time(
-        self, city_name: str, time: datetime
-    ) -> Weather:
+        self, city_name: str, time: datetime,
+        fields: tuple[str, ...] = WEATHER_FIELDS
+    ) -> WeatherResult:
         """
         Возвращает погоду в городе во время, наиболее близкое к указанному.
+        Из БД читаются только параметры погоды fields.
         Запросом к Open-Meteo API отправляется только тогда, если его нет в БД.
+        Город с погодой берется из кэша городов, поэтому для часто
+        запрашиваемых городов БД не используется. При промахе кэша из БД
+        читается только город и одна запись по индексу (city_id, time),
+        а весь ряд города загружается в кэш в фоне.
+        Устаревшие данные отдаются с пометкой stale.
+        Время с часовым поясом переводится в UTC.
         """
+        time = to_naive_utc(time)
         if time.date() != date.today():
             raise TimeRangeError("The time should be today")
 
-        city = await self.city_repo.get_city_by_name(city_name)
+        city = await self.city_repo.get_city_by_name(city_name,
+                                                     with_weather=False)
 
         try:  # В начале пытаемся получить погоду из БД
             logger.info("Trying to get weather from DB")
-            weather_records = city.get_weather_records()
-            weather = self._search_closest_to_time_weather_record(
-                weather_records, time)
-            logger.info("Weather found in DB")
+            weather = await self._get_weather_record_at_time(city, time,
+                                                             fields)
         except WeatherInCityNotFoundError:  # Если в БД нет, то запрос к API
             logger.info("Getting weather from API")
-            weather = await self._get_weather_closest_to_time(
-                city.coordinates, time)
+            return await self._get_weather_closest_to_time(
+                city.coordinates, time, method="city_at_time")
+        logger.info("Weather found in DB")
+        return self._check_freshness(city, weather, method="city_at_time")
+
+    async def get_city_data_version(self, city_name: str) -> DataVersion:
+        """
+        Версия погодных данных города (для условных запросов) без
+        загрузки и преобразования погодных записей.
+        max_age - время до запланированного обновления погоды города;
+        для городов, которые обновляет другой процесс, - оценка по
+        времени последнего изменения и интервалу обновления.
+        """
+        city_id, data_version = await self.city_repo.get_city_data_version(
+            city_name)
+        max_age = weather_update_scheduler.seconds_until_refresh(city_id)
+        if max_age is None and data_version.updated_at is not None:
+            age = (utc_now() - data_version.updated_at).total_seconds()
+            max_age = max(0.0, weather_update_scheduler.interval - age)
+        return data_version._replace(max_age=max_age)
+
+    async def get_city_names_by_id(
+            self, city_names: list[str]) -> dict[int, str]:
+        """
+        ID и названия отслеживаемых городов (для подписки на изменения
+        погоды). Если какой-то город не найден, бросает CityNotFoundError.
+        """
+        cities = await self.city_repo.get_cities_by_ids_or_names(
+            [], city_names)
+        missing_names = set(city_names) - {city.name for city in cities}
+        if missing_names:
+            raise CityNotFoundError(
+                f"Cities with names {sorted(missing_names)} not found")
+        return {city.id: city.name for city in cities}
+
+    async def get_weather_batch(
+        self, items: list[WeatherBatchItem]
+    ) -> list[WeatherResult | Exception]:
+        """
+        Возвращает погоду для нескольких городов и координат, каждую -
+        во время, наиболее близкое к указанному (по умолчанию текущему).
+        Отслеживаемые города (по названию или ближайшие к координатам
+        в пределах CITY_COORDINATES_TOLERANCE_KM) берутся из кэша городов,
+        остальные читаются из БД одним запросом; записи, ближайшие ко
+        времени, ищутся в памяти. Погода для прочих координат запрашивается
+        у Open-Meteo пачками по WEATHER_UPDATE_BATCH_SIZE локаций.
+        Для каждого элемента возвращает результат или ошибку
+        в том же порядке.
+        """
+        logger.info("Getting weather for %s locations", len(items))
+        now = datetime.now()
+        nearest_city_ids: dict[int, int] = {}
+        for index, item in enumerate(items):
+            if item.coordinates is None:
+                continue
+            city_id = self.city_repo.get_nearest_city_id(
+                item.coordinates, config.CITY_COORDINATES_TOLERANCE_KM)
+            if city_id is not None:
+                nearest_city_ids[index] = city_id
+        cities = await self.city_repo.get_cities_by_ids_or_names(
+            nearest_city_ids.values(),
+            [item.city_name for item in items if item.city_name is not None])
+        cities_by_id = {city.id: city for city in cities}
+        cities_by_name = {city.name: city for city in cities}
+
+        results: list[WeatherResult | Exception | None] = [None] * len(items)
+        # Координаты без погоды в БД -> элементы запроса
+        unknown: dict[tuple[float, float], list[int]] = {}
+        for index, item in enumerate(items):
+            time = item.time or now
+            if time.date() != date.today():
+                results[index] = TimeRangeError("The time should be today")
+                continue
+            if item.city_name is not None:
+                city = cities_by_name.get(item.city_name)
+                if city is None:
+                    results[index] = CityNotFoundError(
+                        f"City with name {item.city_name} not found")
+                    continue
+            else:
+                city = cities_by_id.get(nearest_city_ids.get(index, -1))
+            if city is not None and city.weather_records:
+                weather = self._search_closest_to_time_weather_record(
+                    city.weather_records, time)
+                results[index] = self._check_freshness(city, weather,
+                                                       method="batch")
+                continue
+            coordinates = (city.coordinates if city is not None
+                           else item.coordinates)
+            if coordinates is not None:
+                unknown.setdefault((coordinates.latitude,
+                                    coordinates.longitude), []).append(index)
+
+        coordinates_list = [
+            Coordinates(latitude=latitude, longitude=longitude)
+            for latitude, longitude in unknown]
+        batch_weather_records = (
+            await self.weather_repo.get_weather_records_in_batches(
+                coordinates_list, config.WEATHER_UPDATE_BATCH_SIZE,
+                config.WEATHER_UPDATE_MAX_CONCURRENCY)
+        )
+        for indexes, weather_records in zip(unknown.values(),
+                                            batch_weather_records):
+            for index in indexes:
+                if isinstance(weather_records, OpenMeteoAPIError):
+                    results[index] = weather_records
+                    continue
+                weather_lookups.labels("batch", "api").inc()
+                results[index] = WeatherResult(
+                    self._search_closest_to_time_weather_record(
+                        weather_records, items[index].time or now))
+        # cast - приведение типов, чтобы не было ошибки от Mypy
+        return cast(list[WeatherResult | Exception], results)
+
+    async def get_weather_history(
+        self, city_name: str, start: datetime, end: datetime,
+        resolution: Resolution, fields: tuple[str, ...] = WEATHER_FIELDS
+    ) -> list[dict[str, Any]]:
+        """
+        Возвращает почасовые или суточные агрегаты погоды в городе
+        за периоды, начавшиеся в диапазоне [start, end].
+        Из БД читаются только агрегаты параметров погоды fields.
+        Время с часовым поясом переводится в UTC.
+        """
+        start, end = to_naive_utc(start), to_naive_utc(end)
+        if start > end:
+            raise TimeRangeError("The start should not be after the end")
+        max_range = MAX_HISTORY_RANGES[resolution]
+        if end - start > max_range:
+            raise TimeRangeError(
+                f"The range should not exceed {max_range.days} days "
+                f"for resolution {resolution.value}")
+
+        city = await self.city_repo.get_city_by_name(city_name,
+                                                     with_weather=False)
+        return await self.history_repo.get_rollups(city.id, resolution,
+                                                   start, end, fields)
+
+    async def _get_weather_record_at_time(
+        self, city: City, time: datetime,
+        fields: tuple[str, ...] = WEATHER_FIELDS
+    ) -> WeatherRecord:
+        """
+        Запись о погоде города, ближайшая к указанному времени.
+        Город из кэша городов содержит ряд погоды - запись ищется в памяти.
+        Иначе из БД выбирается запись только с параметрами fields,
+        а город загружается в кэш в фоне.
+        """
+        if city.weather_records:
+            return self._search_closest_to_time_weather_record(
+                city.weather_records, time)
+        weather = await self.city_repo.get_weather_record_nearest_to_time(
+            city.id, time, fields)
+        city_cache_loader.request(city.id)
         return weather
 
+    def _check_freshness(self, city: City, weather: WeatherRecord,
+                         method: str) -> WeatherResult:
+        """
+        Запись из БД города, погода которого не обновлялась дольше
+        WEATHER_FRESHNESS_WINDOW (например, Open-Meteo недоступен),
+        отдается с пометкой stale, а погода города обновляется в фоне.
+        Время обновления - последнее успешное обновление прогноза любым
+        процессом, даже без изменения записей (City.refreshed_at; для
+        городов без него - последнее изменение записей City.updated_at),
+        или, для городов этого процесса, время обновления из
+        планировщика, еще не видное в кэше городов.
+        """
+        refreshed_at = max(
+            (value for value in (
+                city.refreshed_at, city.updated_at,
+                weather_update_scheduler.last_refreshed_at(city.id))
+             if value is not None),
+            default=None)
+        if (refreshed_at is not None
+                and utc_now() - refreshed_at <= self.freshness_window):
+            weather_lookups.labels(method, "db").inc()
+            return WeatherResult(weather, from_db=True)
+        logger.warning("Weather in DB for city %s is stale, refreshing "
+                       "in background", city.id)
+        weather_update_scheduler.request_refresh(city)
+        weather_lookups.labels(method, "db_stale").inc()
+        return WeatherResult(weather, stale=True, from_db=True)
+
     def _search_closest_to_time_weather_record(
-        self, weather_records: list[Weather], time: datetime
+        self, weather_records: WeatherSeries, time: datetime
     ) -> Weather:
         """Возвращает запись о погоде, ближайшую к указанному времени."""
-        return min(weather_records, key=lambda record: abs(record.time - time))
+        return weather_records.nearest(time)
 
     async def _get_weather_closest_to_time(
-        self, coordinates: Coordinates, time: datetime
-    ) -> Weather:
-        weather_records = await self.weather_repo.get_weather_records_by_coord(
-            coordinates
+        self, coordinates: Coordinates, time: datetime, method: str
+    ) -> WeatherResult:
+        weather_records, stale = (
+            await self.weather_repo.get_weather_records_by_coord(coordinates)
         )
         closest_weather = self._search_closest_to_time_weather_record(
             weather_records, time
         )
-        return closest_weather
+        weather_lookups.labels(method,
+                               "cache_stale" if stale else "api").inc()
+        return WeatherResult(closest_weather, stale)
@@ -0,0 +1,17 @@
+from datetime import datetime, timezone
+
+
+def utc_now() -> datetime:
+    """Текущее время UTC без часового пояса (как хранится в БД)."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def to_naive_utc(value: datetime) -> datetime:
+    """
+    Время с часовым поясом переводится в UTC без пояса: в нем Open-Meteo
+    возвращает прогноз (параметр timezone не передается) и хранятся
+    записи о погоде. Время без пояса не изменяется.
+    """
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
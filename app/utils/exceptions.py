@@ -1,18 +1,34 @@
-from app.utils.log import logger
+from app.utils.log import get_logger
+
+logger = get_logger(__name__)
 
 
 class OpenMeteoAPIError(Exception):
     """Общий класс ошибок для API open-meteo."""
     def __init__(self, message="Open-Meteo API error"):
         super().__init__(message)
-        logger.error(message)
+        logger.debug("%s", message)
+
+
+class OpenMeteoUnavailableError(OpenMeteoAPIError):
+    """Ошибка, означающая недоступность open-meteo (ошибка соединения,
+    HTTP 5xx или 429) - запрос имеет смысл повторить позже."""
+    def __init__(self, message="Open-Meteo API is unavailable"):
+        super().__init__(message)
+
+
+class CircuitOpenError(OpenMeteoUnavailableError):
+    """Ошибка, возникающая, когда запросы к open-meteo временно
+    не выполняются из-за разомкнутого предохранителя."""
+    def __init__(self, message="Open-Meteo circuit breaker is open"):
+        super().__init__(message)
 
 
 class CityNotFoundError(Exception):
     """Ошибка, возникающая, когда город не найден."""
     def __init__(self, message="City not found"):
         super().__init__(message)
-        logger.error(message)
+        logger.debug("%s", message)
 
 
 class WeatherInCityNotFoundError(Exception):
@@ -20,21 +36,21 @@ class WeatherInCityNotFoundError(Exception):
     ни одна погодная запись для города."""
     def __init__(self, message="Weather in city not found"):
         super().__init__(message)
-        logger.error(message)
+        logger.debug("%s", message)
 
 
 class TimeRangeError(Exception):
     """Ошибка, возникающая, когда диапазон времени некорректен."""
     def __init__(self, message="Time range error"):
         super().__init__(message)
-        logger.error(message)
+        logger.debug("%s", message)
 
 
 class SameCityExistsError(Exception):
     """Ошибка, означающая дублирование города (по тем или иным критейриям)."""
     def __init__(self, message="Same city exists error"):
         super().__init__(message)
-        logger.error(message)
+        logger.debug("%s", message)
 
 
 class CitySameNameExistsError(SameCityExistsError):
@@ -42,7 +58,7 @@ class CitySameNameExistsError(SameCityExistsError):
     которое однозначно идентифицирует другой город"""
     def __init__(self, message="City with same name exists error"):
         super().__init__(message)
-        logger.error(message)
+        logger.debug("%s", message)
 
 
 class CitySameCordsExistsError(SameCityExistsError):
@@ -50,4 +66,11 @@ class CitySameCordsExistsError(SameCityExistsError):
     которые однозначно идентифицируют другой город."""
     def __init__(self, message="City with same cordiantes exists error"):
         super().__init__(message)
-        logger.error(message)
+        logger.debug("%s", message)
+
+
+class DatabaseConfigError(Exception):
+    """Ошибка настройки БД: URL базы данных с неподдерживаемым диалектом."""
+    def __init__(self, message="Database configuration error"):
+        super().__init__(message)
+        logger.debug("%s", message)
@@ -0,0 +1,69 @@
+import zlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from fastapi import Request, Response
+
+from app.schemas.city import DataVersion
+
+
+def make_etag(data_version: DataVersion, request: Request) -> str:
+    """
+    Слабый ETag из версии данных и query-параметров запроса
+    (время, набор параметров погоды и т.п. меняют представление).
+    """
+    query_hash = zlib.crc32(request.url.query.encode())
+    return f'W/"{data_version.tag}-{query_hash:x}"'
+
+
+def get_cache_headers(etag: str,
+                      data_version: DataVersion) -> dict[str, str]:
+    """
+    Заголовки ETag, Last-Modified и Cache-Control (max-age - до
+    следующего обновления данных). Если время обновления неизвестно,
+    ответ можно хранить, но перед использованием нужно перепроверить
+    (no-cache).
+    """
+    headers = {"ETag": etag}
+    if data_version.updated_at is not None:
+        headers["Last-Modified"] = format_datetime(
+            data_version.updated_at.replace(tzinfo=timezone.utc),
+            usegmt=True)
+    if data_version.max_age is None:
+        headers["Cache-Control"] = "no-cache"
+    else:
+        headers["Cache-Control"] = f"max-age={int(data_version.max_age)}"
+    return headers
+
+
+def is_not_modified(request: Request, etag: str,
+                    updated_at: datetime | None) -> bool:
+    """
+    Проверка условного запроса (RFC 9110, раздел 13): If-None-Match
+    сравнивается с ETag слабым сравнением, If-Modified-Since
+    учитывается, только если If-None-Match нет.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        opaque_tag = etag.removeprefix("W/")
+        return any(tag.strip().removeprefix("W/") == opaque_tag
+                   for tag in if_none_match.split(","))
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is None or updated_at is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    # Last-Modified передается с точностью до секунды
+    modified = updated_at.replace(tzinfo=timezone.utc, microsecond=0)
+    return modified <= since
+
+
+def not_modified_response(headers: dict[str, str]) -> Response:
+    """Ответ 304 без тела с заголовками кэширования."""
+    return Response(status_code=304, headers=headers)
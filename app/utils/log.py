@@ -1,19 +1,100 @@
+import atexit
 import logging
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener
 
-# Конфигурация логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.FileHandler("app.log"),
+from app import config
+
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Пропускает лишь долю sample_rate записей уровня INFO и ниже
+    от логгеров с указанными префиксами (логи на каждый запрос).
+    Предупреждения и ошибки пропускаются всегда.
+    """
+
+    def __init__(self, sample_rate: float, logger_prefixes: tuple[str, ...]):
+        super().__init__()
+        self.sample_rate = sample_rate
+        self.logger_prefixes = logger_prefixes
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if (record.levelno > logging.INFO
+                or not record.name.startswith(self.logger_prefixes)):
+            return True
+        return random.random() < self.sample_rate
+
+
+class LazyQueueHandler(QueueHandler):
+    """
+    QueueHandler, который не форматирует сообщение в вызывающем потоке:
+    форматирование и ввод-вывод выполняются в потоке QueueListener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def _parse_levels(levels: str) -> dict[str, str]:
+    """Разбор строки вида "app.repositories=WARNING,app.services=DEBUG"."""
+    parsed = {}
+    for item in levels.split(","):
+        if "=" in item:
+            name, level = item.split("=", 1)
+            parsed[name.strip()] = level.strip().upper()
+    return parsed
+
+
+def setup_logging() -> QueueListener | None:
+    """
+    Настраивает логирование приложения. В режиме LOG_QUEUE запись в файл и
+    консоль выполняет фоновый поток, а event loop только кладет записи
+    в очередь.
+    """
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers: list[logging.Handler] = [
+        logging.FileHandler(config.LOG_FILE),
         logging.StreamHandler()
     ]
-)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    listener = None
+    root_handlers = handlers
+    if config.LOG_QUEUE:
+        log_queue: queue.SimpleQueue = queue.SimpleQueue()
+        listener = QueueListener(log_queue, *handlers,
+                                 respect_handler_level=True)
+        listener.start()
+        atexit.register(listener.stop)
+        root_handlers = [LazyQueueHandler(log_queue)]
+
+    sampling_filter = SamplingFilter(config.LOG_SAMPLE_RATE,
+                                     config.LOG_SAMPLED_LOGGERS)
+    for handler in root_handlers:
+        handler.addFilter(sampling_filter)
+
+    logging.basicConfig(level=config.LOG_LEVEL, handlers=root_handlers)
+
+    # Настройка уровня логирования для конкретных логгеров
+    logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
+    logging.getLogger("uvicorn").setLevel(logging.WARNING)
+    logging.getLogger("fastapi").setLevel(logging.WARNING)
+    # Уровни логирования подсистем приложения из конфигурации
+    for name, level in _parse_levels(config.LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level)
+    return listener
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Логгер подсистемы приложения (например, app.repositories.db)."""
+    return logging.getLogger(name)
+
 
-# Настройка уровня логирования для конкретных логгеров
-logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
-logging.getLogger("uvicorn").setLevel(logging.WARNING)
-logging.getLogger("fastapi").setLevel(logging.WARNING)
+log_listener = setup_logging()
 
 # Глобальный логгер
 logger = logging.getLogger("app")
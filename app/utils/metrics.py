@@ -0,0 +1,198 @@
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Callable, Iterator
+
+# Границы корзин гистограмм (сек)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                      0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+LAG_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def _escape(value: str) -> str:
+    return (value.replace("\\", "\\\\").replace('"', '\\"')
+            .replace("\n", "\\n"))
+
+
+def _format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"'
+                          for name, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _CounterValue:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+
+class _HistogramValue:
+    __slots__ = ("upper_bounds", "bucket_counts", "sum", "count")
+
+    def __init__(self, upper_bounds: tuple[float, ...]) -> None:
+        self.upper_bounds = upper_bounds
+        # Последняя корзина - значения больше всех границ (+Inf)
+        self.bucket_counts = [0] * (len(upper_bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.bucket_counts[bisect_left(self.upper_bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metric(ABC):
+    """
+    Базовый класс метрики с набором меток.
+    Значения изменяются только из потока event loop, поэтому обновление
+    метрики - обычное сложение без блокировок.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str,
+                 labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._children: dict[tuple[str, ...], object] = {}
+        metrics_registry.register(self)
+
+    @abstractmethod
+    def _new_child(self) -> object:
+        """Новое значение метрики для очередного набора меток."""
+
+    def labels(self, *values: str):
+        """Значение метрики для указанных значений меток."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(
+                    f"Metric {self.name} expects labels {self.labelnames}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _iter_children(self) -> Iterator[tuple[dict[str, str], object]]:
+        for values, child in self._children.items():
+            yield dict(zip(self.labelnames, values)), child
+
+    @abstractmethod
+    def collect(self) -> Iterator[str]:
+        """Строки метрики в текстовом формате Prometheus."""
+
+
+class Counter(Metric):
+    """Монотонно возрастающий счетчик."""
+
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def _new_child(self) -> _CounterValue:
+        return _CounterValue()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default.inc(amount)
+
+    def collect(self) -> Iterator[str]:
+        for labels, child in self._iter_children():
+            assert isinstance(child, _CounterValue)
+            yield (f"{self.name}{_format_labels(labels)} "
+                   f"{_format_value(child.value)}")
+
+
+class Histogram(Metric):
+    """
+    Гистограмма с заранее заданными корзинами: наблюдение - бинарный
+    поиск корзины и инкремент счетчика, накопленные суммы по корзинам
+    считаются только при выгрузке метрик.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str,
+                 labelnames: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def _new_child(self) -> _HistogramValue:
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self._default.observe(value)
+
+    def collect(self) -> Iterator[str]:
+        for labels, child in self._iter_children():
+            assert isinstance(child, _HistogramValue)
+            cumulative = 0
+            for upper_bound, bucket_count in zip(
+                    self.buckets + (float("inf"),), child.bucket_counts):
+                cumulative += bucket_count
+                bucket_labels = {**labels, "le": _format_value(upper_bound)}
+                yield (f"{self.name}_bucket{_format_labels(bucket_labels)} "
+                       f"{cumulative}")
+            yield (f"{self.name}_sum{_format_labels(labels)} "
+                   f"{_format_value(child.sum)}")
+            yield f"{self.name}_count{_format_labels(labels)} {child.count}"
+
+
+class CallbackMetric(Metric):
+    """
+    Метрика без меток, значение которой вычисляется функцией при выгрузке
+    (например, размер кэша или уже подсчитанные объектом счетчики).
+    """
+
+    def __init__(self, name: str, documentation: str, kind: str,
+                 callback: Callable[[], float]):
+        self.kind = kind
+        self.callback = callback
+        super().__init__(name, documentation)
+
+    def _new_child(self) -> object:
+        raise TypeError(f"Metric {self.name} is computed by callback "
+                        "and has no label values")
+
+    def collect(self) -> Iterator[str]:
+        yield f"{self.name} {_format_value(self.callback())}"
+
+
+class MetricsRegistry:
+    """Набор метрик приложения, выгружаемых в текстовом формате Prometheus."""
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> None:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+metrics_registry = MetricsRegistry()
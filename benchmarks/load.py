@@ -0,0 +1,233 @@
+"""
+Нагрузочный тест API. Запускает приложение (script:app) и заглушку
+Open-Meteo в отдельных процессах на временной БД и нагружает
+/api/add_city, /api/weather, /api/weather/{city_name} и /api/cities
+с заданными уровнями конкурентности.
+
+Запуск: python -m benchmarks.load --concurrency 1,10,50 --output load.json
+"""
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from itertools import count
+from typing import Awaitable, Callable
+
+import httpx
+
+from benchmarks.report import ROOT_DIR, summarize_latencies, write_report
+
+RequestFactory = Callable[[httpx.AsyncClient, int], Awaitable[httpx.Response]]
+
+
+def _start_process(args: list[str], env: dict[str, str],
+                   log_path: str) -> subprocess.Popen:
+    with open(log_path, "ab") as log_file:
+        return subprocess.Popen([sys.executable, *args], cwd=ROOT_DIR,
+                                env=env, stdout=log_file,
+                                stderr=subprocess.STDOUT)
+
+
+def _wait_ready(url: str, process: subprocess.Popen,
+                timeout: float = 30.0) -> None:
+    """Ожидает, пока сервер начнет отвечать на запросы."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Process for {url} exited with code "
+                               f"{process.returncode}")
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.TransportError:
+            time.sleep(0.1)
+    raise TimeoutError(f"{url} is not ready after {timeout} s")
+
+
+async def run_level(client: httpx.AsyncClient, make_request: RequestFactory,
+                    concurrency: int, requests: int) -> dict:
+    """
+    Выполняет requests запросов, не более concurrency одновременно.
+    Возвращает пропускную способность и перцентили задержки.
+    """
+    latencies: list[float] = []
+    errors = 0
+    request_numbers = iter(range(requests))
+
+    async def worker() -> None:
+        nonlocal errors
+        for number in request_numbers:
+            start_time = time.perf_counter()
+            try:
+                response = await make_request(client, number)
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            latencies.append(time.perf_counter() - start_time)
+            errors += failed
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    duration = time.perf_counter() - start_time
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": errors,
+        "duration_s": duration,
+        "throughput_rps": requests / duration if duration else 0.0,
+        "latency_ms": summarize_latencies(latencies),
+    }
+
+
+def _make_scenarios(seed: int) -> dict[str, RequestFactory]:
+    """Сценарии нагрузки; города, добавленные в add_city, используются
+    остальными сценариями."""
+    rng = random.Random(seed)
+    city_numbers = count()
+    cities: list[tuple[str, float, float]] = []
+
+    async def add_city(client: httpx.AsyncClient,
+                       number: int) -> httpx.Response:
+        city_number = next(city_numbers)
+        # Координаты на сетке, чтобы города не совпадали
+        latitude = round(-60 + (city_number // 360) * 0.5, 4)
+        longitude = round(-180 + (city_number % 360), 4)
+        name = f"bench-city-{city_number}"
+        response = await client.post("/api/add_city", json={
+            "name": name,
+            "coordinates": {"latitude": latitude, "longitude": longitude},
+        })
+        if response.status_code == 201:
+            cities.append((name, latitude, longitude))
+        return response
+
+    def choose_city() -> tuple[str, float, float]:
+        if not cities:
+            raise RuntimeError("No cities added: run the add_city scenario "
+                               "first")
+        return rng.choice(cities)
+
+    async def weather(client: httpx.AsyncClient,
+                      number: int) -> httpx.Response:
+        _, latitude, longitude = choose_city()
+        return await client.get("/api/weather", params={
+            "latitude": latitude, "longitude": longitude})
+
+    async def weather_in_city(client: httpx.AsyncClient,
+                              number: int) -> httpx.Response:
+        name, _, _ = choose_city()
+        return await client.get(f"/api/weather/{name}", params={
+            "time": datetime.now().isoformat(timespec="minutes")})
+
+    async def cities_list(client: httpx.AsyncClient,
+                          number: int) -> httpx.Response:
+        return await client.get("/api/cities", params={"limit": 100})
+
+    return {
+        "add_city": add_city,
+        "weather": weather,
+        "weather_in_city": weather_in_city,
+        "cities": cities_list,
+    }
+
+
+async def run_scenarios(base_url: str, scenarios: list[str],
+                        concurrency_levels: list[int], requests: int,
+                        seed: int) -> list[dict]:
+    factories = _make_scenarios(seed)
+    results = []
+    limits = httpx.Limits(max_connections=max(concurrency_levels))
+    async with httpx.AsyncClient(base_url=base_url, limits=limits,
+                                 timeout=60.0) as client:
+        for scenario in scenarios:
+            for concurrency in concurrency_levels:
+                result = await run_level(client, factories[scenario],
+                                         concurrency, requests)
+                result["scenario"] = scenario
+                results.append(result)
+                latency = result["latency_ms"]
+                print(f"{scenario:>16} c={concurrency:<4} "
+                      f"{result['throughput_rps']:8.1f} rps  "
+                      f"p50={latency.get('p50', 0):7.2f} ms  "
+                      f"p95={latency.get('p95', 0):7.2f} ms  "
+                      f"p99={latency.get('p99', 0):7.2f} ms  "
+                      f"errors={result['errors']}", file=sys.stderr)
+    return results
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--concurrency", default="1,10,50",
+                        help="Уровни конкурентности через запятую")
+    parser.add_argument("--requests", type=int, default=200,
+                        help="Число запросов на каждый уровень")
+    parser.add_argument("--scenarios",
+                        default="add_city,weather,weather_in_city,cities")
+    parser.add_argument("--stub-latency", type=float, default=0.05,
+                        help="Задержка ответа заглушки Open-Meteo (сек)")
+    parser.add_argument("--stub-error-rate", type=float, default=0.0)
+    parser.add_argument("--app-port", type=int, default=8000)
+    parser.add_argument("--stub-port", type=int, default=8081)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None,
+                        help="Файл для JSON-отчета (по умолчанию stdout)")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = _parse_args()
+    concurrency_levels = [int(value) for value in
+                          args.concurrency.split(",")]
+    scenarios = args.scenarios.split(",")
+    host = "127.0.0.1"
+
+    with tempfile.TemporaryDirectory(prefix="weather-bench-") as work_dir:
+        env = {
+            **os.environ,
+            "DATABASE_URL": f"sqlite+aiosqlite:///{work_dir}/bench.db",
+            "OPEN_METEO_URL": f"http://{host}:{args.stub_port}/v1/forecast",
+            "LOG_FILE": os.path.join(work_dir, "app.log"),
+        }
+        log_path = os.path.join(work_dir, "servers.log")
+        processes = [
+            _start_process(
+                ["-m", "benchmarks.open_meteo_stub", "--host", host,
+                 "--port", str(args.stub_port),
+                 "--latency", str(args.stub_latency),
+                 "--error-rate", str(args.stub_error_rate),
+                 "--seed", str(args.seed)], env, log_path),
+            _start_process(
+                ["-m", "uvicorn", "script:app", "--host", host,
+                 "--port", str(args.app_port), "--log-level", "warning"],
+                env, log_path),
+        ]
+        try:
+            _wait_ready(f"http://{host}:{args.stub_port}/docs", processes[0])
+            _wait_ready(f"http://{host}:{args.app_port}/metrics",
+                        processes[1])
+            results = asyncio.run(run_scenarios(
+                f"http://{host}:{args.app_port}", scenarios,
+                concurrency_levels, args.requests, args.seed))
+        finally:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.wait(timeout=10)
+
+    write_report(args.output, "load", {
+        "concurrency": concurrency_levels,
+        "requests": args.requests,
+        "scenarios": scenarios,
+        "stub_latency": args.stub_latency,
+        "stub_error_rate": args.stub_error_rate,
+        "seed": args.seed,
+    }, results)
+
+
+if __name__ == "__main__":
+    main()
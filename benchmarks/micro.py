@@ -0,0 +1,151 @@
+"""
+Микробенчмарки горячих участков кода: разбор ответа Open-Meteo,
+конвертация CityORM в City, upsert погодных записей и формирование
+ответа о погоде.
+
+Запуск: python -m benchmarks.micro --output micro.json
+"""
+import argparse
+import asyncio
+import atexit
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from typing import Awaitable, Callable, Iterable
+
+# Временная БД и логирование настраиваются до импорта приложения
+BENCH_DIR = tempfile.mkdtemp(prefix="weather-bench-")
+atexit.register(shutil.rmtree, BENCH_DIR, ignore_errors=True)
+os.environ.setdefault("DATABASE_URL",
+                      f"sqlite+aiosqlite:///{BENCH_DIR}/bench.db")
+os.environ.setdefault("LOG_FILE", os.path.join(BENCH_DIR, "app.log"))
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from app.repositories.city_repository import CityRepository  # noqa: E402
+from app.repositories.db import create_tables, get_db  # noqa: E402
+from app.repositories.models import CityORM, WeatherORM  # noqa: E402
+from app.repositories.open_meteo_api import parse_weather  # noqa: E402
+from app.schemas.city import City  # noqa: E402
+from app.schemas.coordinates import Coordinates  # noqa: E402
+from app.schemas.weather import WeatherResponse  # noqa: E402
+from app.schemas.weather_series import WeatherSeries  # noqa: E402
+from benchmarks.open_meteo_stub import make_location_payload  # noqa: E402
+from benchmarks.report import write_report  # noqa: E402
+
+
+def _summarize(name: str, timings: list[float], number: int) -> dict:
+    """Время одного вызова (мкс) по результатам повторов."""
+    per_call = sorted(timing / number * 1e6 for timing in timings)
+    return {
+        "name": name,
+        "number": number,
+        "repeat": len(timings),
+        "best_us": per_call[0],
+        "median_us": statistics.median(per_call),
+        "mean_us": statistics.fmean(per_call),
+    }
+
+
+def bench(name: str, func: Callable[[], object],
+          number: int, repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append(time.perf_counter() - start_time)
+    return _summarize(name, timings, number)
+
+
+async def bench_async(name: str, func: Callable[[], Awaitable[object]],
+                      number: int, repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        for _ in range(number):
+            await func()
+        timings.append(time.perf_counter() - start_time)
+    return _summarize(name, timings, number)
+
+
+def _make_city_orm(weather_records: WeatherSeries) -> CityORM:
+    return CityORM(
+        id=1, name="Moscow", latitude=55.7558, longitude=37.6173,
+        weather_records=[WeatherORM(id=index, city_id=1, **row)
+                         for index, row in enumerate(weather_records.rows())]
+    )
+
+
+def _shift_values(weather_records: WeatherSeries,
+                  delta: float) -> WeatherSeries:
+    """Копия ряда с измененной температурой - для upsert с изменениями."""
+    columns: dict[str, Iterable[float]] = dict(weather_records.columns)
+    columns["temperature_2m"] = [
+        value + delta for value in weather_records.columns["temperature_2m"]]
+    return WeatherSeries(weather_records.times, columns)
+
+
+async def run_benchmarks(number: int, repeat: int) -> list[dict]:
+    payload = make_location_payload(55.7558, 37.6173)
+    weather_records = parse_weather(payload)
+    weather = weather_records.record_at(len(weather_records) // 2)
+    city_orm = _make_city_orm(weather_records)
+
+    results = [
+        bench("parse_weather", lambda: parse_weather(payload),
+              number, repeat),
+        bench("WeatherResponse.build_response",
+              lambda: WeatherResponse.build_response(weather),
+              number * 10, repeat),
+    ]
+
+    await create_tables()
+    async with get_db() as db:
+        city_repo = CityRepository(db)
+        results.append(bench(
+            "CityRepository._convert_orm_to_city",
+            lambda: city_repo._convert_orm_to_city(city_orm),
+            number, repeat))
+
+        city = await city_repo.save_city(City(
+            name="Moscow",
+            coordinates=Coordinates(latitude=55.7558, longitude=37.6173),
+            weather_records=weather_records
+        ))
+        # Без изменений upsert не перезаписывает строки
+        results.append(await bench_async(
+            "CityRepository.update_weather_records[unchanged]",
+            lambda: city_repo.update_weather_records(city.id,
+                                                     weather_records),
+            number, repeat))
+        deltas = iter(range(1, number * repeat + 1))
+        results.append(await bench_async(
+            "CityRepository.update_weather_records[changed]",
+            lambda: city_repo.update_weather_records(
+                city.id, _shift_values(weather_records, next(deltas))),
+            number, repeat))
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=100,
+                        help="Число вызовов в одном повторе")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default=None,
+                        help="Файл для JSON-отчета (по умолчанию stdout)")
+    args = parser.parse_args()
+
+    results = asyncio.run(run_benchmarks(args.number, args.repeat))
+    write_report(args.output, "micro", {
+        "number": args.number,
+        "repeat": args.repeat,
+        "weather_records": len(parse_weather(make_location_payload(
+            55.7558, 37.6173))),
+    }, results)
+
+
+if __name__ == "__main__":
+    main()
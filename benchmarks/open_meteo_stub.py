@@ -0,0 +1,142 @@
+"""
+Локальная заглушка Open-Meteo API (/v1/forecast) для бенчмарков.
+Отдает прогноз minutely_15 в формате api.open-meteo.com с настраиваемой
+задержкой и долей ошибок.
+
+Запуск: python -m benchmarks.open_meteo_stub --port 8081 --latency 0.05
+"""
+import argparse
+import asyncio
+import random
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
+
+from app.schemas.weather import WEATHER_FIELDS
+
+FORECAST_DAYS = 7
+STEPS_PER_DAY = 24 * 4
+
+# Диапазоны значений и единицы измерения параметров погоды
+FIELD_RANGES = {
+    "temperature_2m": (-20.0, 35.0),
+    "wind_speed_10m": (0.0, 25.0),
+    "pressure_msl": (980.0, 1040.0),
+    "rain": (0.0, 2.0),
+    "relative_humidity_2m": (20.0, 100.0),
+}
+FIELD_UNITS = {
+    "temperature_2m": "°C",
+    "wind_speed_10m": "km/h",
+    "pressure_msl": "hPa",
+    "rain": "mm",
+    "relative_humidity_2m": "%",
+}
+
+
+@lru_cache(maxsize=4096)
+def make_location_payload(latitude: float, longitude: float,
+                          fields: tuple[str, ...] = WEATHER_FIELDS,
+                          start_day: date | None = None,
+                          forecast_days: int = FORECAST_DAYS) -> dict:
+    """
+    Прогноз для одной локации в формате ответа Open-Meteo.
+    Значения псевдослучайные, но детерминированные для координат.
+    """
+    start = datetime.combine(start_day or date.today(), time.min)
+    steps = forecast_days * STEPS_PER_DAY
+    rng = random.Random(f"{latitude},{longitude}")
+    minutely_15: dict[str, list] = {
+        "time": [(start + timedelta(minutes=15 * step)).isoformat("T",
+                                                                  "minutes")
+                 for step in range(steps)]
+    }
+    for name in fields:
+        low, high = FIELD_RANGES[name]
+        minutely_15[name] = [round(rng.uniform(low, high), 1)
+                             for _ in range(steps)]
+    return {
+        "latitude": latitude,
+        "longitude": longitude,
+        "generationtime_ms": 0.1,
+        "utc_offset_seconds": 0,
+        "timezone": "GMT",
+        "timezone_abbreviation": "GMT",
+        "elevation": 150.0,
+        "minutely_15_units": {
+            "time": "iso8601",
+            **{name: FIELD_UNITS[name] for name in fields}
+        },
+        "minutely_15": minutely_15,
+    }
+
+
+def _error(reason: str, status_code: int) -> ORJSONResponse:
+    return ORJSONResponse({"error": True, "reason": reason},
+                          status_code=status_code)
+
+
+def create_stub_app(latency: float = 0.0, error_rate: float = 0.0,
+                    seed: int | None = None) -> FastAPI:
+    """
+    Приложение-заглушка: каждый ответ задерживается на latency секунд,
+    доля error_rate запросов завершается ошибкой HTTP 500.
+    """
+    stub_app = FastAPI()
+    rng = random.Random(seed)
+
+    @stub_app.get("/v1/forecast")
+    async def forecast(latitude: str, longitude: str,
+                       minutely_15: str = "",
+                       start_date: date | None = None,
+                       end_date: date | None = None):
+        if latency > 0:
+            await asyncio.sleep(latency)
+        if rng.random() < error_rate:
+            return _error("Stub error", 500)
+
+        latitudes = [float(value) for value in latitude.split(",")]
+        longitudes = [float(value) for value in longitude.split(",")]
+        if len(latitudes) != len(longitudes):
+            return _error("Parameter 'latitude' and 'longitude' must have "
+                          "the same number of elements", 400)
+        fields = tuple(name for name in minutely_15.split(",")
+                       if name in FIELD_RANGES)
+        # Как и Open-Meteo, start_date и end_date задаются вместе
+        forecast_days = FORECAST_DAYS
+        if start_date is not None and end_date is not None:
+            if end_date < start_date:
+                return _error("Parameter 'end_date' must not be before "
+                              "'start_date'", 400)
+            forecast_days = (end_date - start_date).days + 1
+        else:
+            start_date = None
+        locations = [make_location_payload(lat, lon, fields, start_date,
+                                           forecast_days)
+                     for lat, lon in zip(latitudes, longitudes)]
+        # Для одной локации Open-Meteo возвращает объект, а не список
+        return ORJSONResponse(locations if len(locations) > 1
+                              else locations[0])
+
+    return stub_app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Задержка каждого ответа (сек)")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Доля ответов с ошибкой HTTP 500")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    uvicorn.run(create_stub_app(args.latency, args.error_rate, args.seed),
+                host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
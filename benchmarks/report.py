@@ -0,0 +1,66 @@
+import json
+import math
+import platform
+import subprocess
+import sys
+from datetime import datetime
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+
+def percentile(sorted_values: list[float], percent: float) -> float:
+    """Перцентиль методом ближайшего ранга по отсортированным значениям."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(percent / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize_latencies(latencies: list[float]) -> dict[str, float]:
+    """Сводка задержек (сек) в миллисекундах."""
+    values = sorted(latencies)
+    if not values:
+        return {}
+    return {
+        "min": values[0] * 1000,
+        "mean": sum(values) / len(values) * 1000,
+        "p50": percentile(values, 50) * 1000,
+        "p95": percentile(values, 95) * 1000,
+        "p99": percentile(values, 99) * 1000,
+        "max": values[-1] * 1000,
+    }
+
+
+def _get_git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT_DIR, capture_output=True,
+            text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_report(path: str | None, benchmark: str, parameters: dict,
+                 results: list[dict]) -> dict:
+    """
+    Сохраняет результаты в JSON вместе с параметрами запуска и окружением,
+    чтобы запуски на разных коммитах можно было сравнивать.
+    Без path отчет выводится в stdout.
+    """
+    report = {
+        "benchmark": benchmark,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": _get_git_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "parameters": parameters,
+        "results": results,
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if path is None:
+        print(text)
+    else:
+        Path(path).write_text(text + "\n", encoding="utf-8")
+    return report
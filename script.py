@@ -3,22 +3,47 @@ from contextlib import asynccontextmanager
 import uvicorn
 from fastapi import FastAPI
 
-from app.repositories.db import create_tables
-from app.routing import cities, weather
+from app.repositories.city_repository import CityRepository
+from app.repositories.db import create_tables, get_db
+from app.repositories.http_client import (close_http_client,
+                                          create_http_client)
+from app.routing import cities, metrics, weather
+from app.services.city_cache_loader import city_cache_loader
+from app.services.retention_service import weather_retention_job
+from app.services.update_weather_services import weather_update_scheduler
+from app.services.weather_pubsub import weather_pubsub
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Создание таблиц перед запуском сервера
     await create_tables()
+    # Пространственный индекс городов для поиска ближайшего по координатам
+    async with get_db() as db:
+        await CityRepository(db).rebuild_spatial_index()
+    # Общий HTTP-клиент с пулом соединений для запросов к Open-Meteo
+    create_http_client()
+    # Восстановление расписания обновления погоды для городов из БД
+    await weather_update_scheduler.start()
+    # Агрегация истории погоды и удаление устаревших записей
+    await weather_retention_job.start()
+    # Рассылка изменений погоды подписчикам
+    await weather_pubsub.start()
     yield
+    await weather_pubsub.stop()
+    await weather_retention_job.stop()
+    await weather_update_scheduler.stop()
+    await city_cache_loader.stop()
+    await close_http_client()
 
 
 app = FastAPI(lifespan=lifespan)
+app.add_middleware(metrics.MetricsMiddleware)
 
 
 app.include_router(weather.router, prefix="/api")
 app.include_router(cities.router, prefix="/api")
+app.include_router(metrics.router)
 
 if __name__ == "__main__":
     uvicorn.run(app, host="127.0.0.1", port=8000)